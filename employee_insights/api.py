@@ -1,56 +1,360 @@
 # std
+import os
+import math
+import base64
+import hashlib
+import binascii
+import datetime
+import time
+import tempfile
 from functools import partial
-from codecs import getreader
-from contextlib import closing
 # 3rd party
-from flask import jsonify, Blueprint, request, Response
+from flask import json, Blueprint, request, Response, current_app, stream_with_context, url_for
+from sqlalchemy.orm import Query
 # local
-from employee_insights import database
+from employee_insights import database, queries, jobs, metrics
+from employee_insights.cache import ResultCache
+from employee_insights.slow_queries import slow_query_log
 from employee_insights.queries import *
-from employee_insights.serializer import CsvSerializer
+from employee_insights.serializer import CsvSerializer, batches
 
 
-def make_response(query, **fields):
+# the number of records fetched from the database and encoded at a time when
+# streaming a json response.
+STREAM_BATCH_SIZE = 1000
+
+
+# the number of employees per page when only a cursor is given, and the
+# maximum number of employees per page.
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10 * DEFAULT_PAGE_SIZE
+
+
+# the maximum number of years values of the older than average curve.
+MAX_CURVE_YEARS = 1000
+
+
+# the defaults of the age quantiles and the boundaries of the age groups of
+# the age distribution.
+DEFAULT_AGE_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+DEFAULT_AGE_GROUPS = (0, 20, 30, 40, 50, 60, 120)
+
+
+# the backend which answers the analytics queries, this is either 'sql' or
+# 'numpy' which keeps the employees in memory as arrays, see
+# ``employee_insights.columnar``.
+ANALYTICS_BACKEND = os.environ.get('EMPLOYEE_INSIGHTS_ANALYTICS_BACKEND', 'sql')
+
+
+def get_analytics(backend):
+    """
+    Get the module with the analytics query functions of a backend.
+
+    :param backend: The name of the backend, see ``ANALYTICS_BACKEND``.
+
+    :return: Module with the analytics query functions.
+
+    :raises ImportError: If the numpy backend is requested without numpy.
+    """
+    if backend == 'numpy':
+        from employee_insights import columnar
+        if columnar.numpy is None:
+            raise ImportError('the numpy analytics backend requires numpy')
+        return columnar
+    if backend == 'sql':
+        return queries
+    raise ValueError(f'unknown analytics backend {backend}')
+
+
+analytics = get_analytics(ANALYTICS_BACKEND)
+result_cache = ResultCache()
+
+
+def get_cache_key(query):
+    """
+    Get the key for caching the result of a query, which is made of the
+    endpoint, the query function with its (already parsed) parameters and
+    the dataset generation.
+
+    :param query: Query function, or partial of a query function.
+
+    :return: Hashable cache key.
+    """
+    func, parameters = query, {}
+    if isinstance(query, partial):
+        func, parameters = query.func, query.keywords
+    generation, _ = result_cache.get_generation()
+    return request.endpoint, func.__name__, tuple(sorted(parameters.items())), generation
+
+
+def get_query_name(query):
+    """
+    :param query: Query function, or partial of a query function.
+
+    :return: The name of the query function.
+    """
+    return query.func.__name__ if isinstance(query, partial) else query.__name__
+
+
+def get_validators(cache_key):
+    """
+    Get the validators for conditional requests of a cacheable result, these
+    only change when the dataset or the query parameters change.
+
+    :param cache_key: The cache key of the result, see ``get_cache_key``.
+
+    :return: tuple of (etag, last modified time), the last modified time is
+             a timezone aware UTC datetime or None when nothing was imported
+             yet.
+    """
+    etag = hashlib.sha1(repr(cache_key).encode('utf-8')).hexdigest()
+    _, imported_at = result_cache.get_generation()
+    last_modified = imported_at.replace(microsecond=0) if imported_at else None
+    return etag, last_modified
+
+
+def is_not_modified(etag, last_modified):
+    """
+    Check whether the client already has the current result, the
+    ``If-None-Match`` header takes precedence over ``If-Modified-Since``.
+
+    :param etag: The etag of the current result.
+    :param last_modified: The last modified time of the current result.
+
+    :return: True if a 304 Not Modified response should be sent.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified:
+        # older versions of werkzeug parse the header as a naive UTC datetime.
+        if_modified_since = request.if_modified_since
+        if if_modified_since.tzinfo is None:
+            if_modified_since = if_modified_since.replace(tzinfo=datetime.timezone.utc)
+        return last_modified <= if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Set the conditional request headers on a response, clients should
+    revalidate before reusing the response.
+
+    :param response: The response to set the headers on.
+    :param etag: The etag of the result.
+    :param last_modified: The last modified time of the result.
+
+    :return: The response.
     """
-    Create a json response from a SQLAlchemy query.
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    return response
+
+
+def make_response(query, cache=True, query_name=None, **fields):
+    """
+    Create a json response from a SQLAlchemy query. The response is streamed,
+    the records are fetched from the result cursor and encoded
+    ``STREAM_BATCH_SIZE`` at a time.
 
     :param query: The SQLAlchemy query to get the json response for.
+    :param cache: Whether the response may be served from and stored in
+                  ``result_cache``, cacheable responses get validators and
+                  conditional requests are answered with 304 Not Modified.
+    :param query_name: The name the query is measured as, defaults to the
+                       name of the query function, see ``get_query_name``.
     :param fields: The fields which should be included in the json.
 
     :return: Json response with a list of dictionaries which are the records
              from the result set of ``query``.
     """
-    with closing(database.get_session()) as session:
-        result = query(session)
-        result_list = [
-            {
-                field_name: field_type(getattr(x, field_name))
-                for field_name, field_type in fields.items()
-            }
-            for x in result
-        ]
-    return jsonify(result_list)
+    cache_key = get_cache_key(query) if cache else None
+    if cache_key:
+        # answer conditional requests before any session is opened.
+        etag, last_modified = get_validators(cache_key)
+        if is_not_modified(etag, last_modified):
+            return set_validators(Response(status=304), etag, last_modified)
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            response = Response(cached, mimetype='application/json')
+            return set_validators(response, etag, last_modified)
+
+    query_name = query_name or get_query_name(query)
+    metrics.set_query(query_name)
+
+    session = database.get_session()
+    result = query(session)
+    if isinstance(result, Query):
+        result = result.yield_per(STREAM_BATCH_SIZE)
+
+    # execute the query before the response is started, so errors still give
+    # an error response.
+    result = iter(result)
+
+    clock = time.perf_counter
+    serialization_seconds = 0.0
+
+    def encode(x):
+        nonlocal serialization_seconds
+        started_at = clock()
+        encoded = json.dumps({
+            field_name: field_type(getattr(x, field_name))
+            for field_name, field_type in fields.items()
+        })
+        serialization_seconds += clock() - started_at
+        return encoded
+
+    def generate():
+        separator = '['
+        n_rows = 0
+        for batch in batches(map(encode, result), STREAM_BATCH_SIZE):
+            yield separator + ','.join(batch)
+            separator = ','
+            n_rows += len(batch)
+        yield ']' if separator == ',' else '[]'
+        metrics.metrics.increment('employee_insights_query_rows_total',
+                                  dict(query=query_name), n_rows)
+        metrics.metrics.observe('employee_insights_serialization_duration_seconds',
+                                dict(endpoint=request.endpoint), serialization_seconds)
+
+    def generate_and_cache():
+        # keep the chunks until the result is known to be too large to cache
+        chunks, size = [], 0
+        for chunk in generate():
+            yield chunk
+            if chunks is not None:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > result_cache.max_entry_size:
+                    chunks = None
+        if chunks is not None:
+            result_cache.set(cache_key, ''.join(chunks))
+
+    if not cache_key:
+        return Response(stream_with_context(generate()), mimetype='application/json')
+    response = Response(stream_with_context(generate_and_cache()), mimetype='application/json')
+    return set_validators(response, etag, last_modified)
 
 
 api = Blueprint('api', __name__)
 
 
+# uploads are streamed into staging tables, committing this many employees at
+# a time so memory use does not depend on the size of the upload. Readers
+# keep seeing the previous dataset until the staging tables are swapped in.
+IMPORT_CHUNK_SIZE = 100000
+
+
+# uploads of at least this many bytes are parsed by PARSE_WORKERS processes,
+# for smaller uploads starting the processes takes longer than parsing.
+PARALLEL_PARSE_MIN_SIZE = 2 ** 25
+PARSE_WORKERS = int(os.environ.get('EMPLOYEE_INSIGHTS_PARSE_WORKERS', os.cpu_count() or 1))
+
+
+# whether the peak allocated memory of the phases of an import is measured,
+# which makes imports considerably slower.
+TRACE_IMPORT_MEMORY = bool(os.environ.get('EMPLOYEE_INSIGHTS_TRACE_IMPORT_MEMORY'))
+
+
 @api.route('/employees/percentage_older_than_average')
 def employees_percentage_older_than_average():
     """
     GET the percentage of employees that a n years older than the company average.
+    Ages are calculated at the ``as_of`` date, which defaults to today.
     """
     years = request.args.get('years') or 0
 
-    query = partial(get_employees_percentage_older_than_average, years=years)
+    try:
+        as_of = get_as_of()
+        years = parse_float(years)
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(analytics.get_employees_percentage_older_than_average, years=years, as_of=as_of)
+    return make_response(
+        query,
+        company_name=str,
+        average_employee_age=int,
+        percentage_older=int,
+    )
+
+
+@api.route('/employees/percentage_older_than_average_curve')
+def employees_percentage_older_than_average_curve():
+    """
+    GET the percentage of employees that are n years older than the company
+    average, for several values of n at once. The values are either given as
+    a comma separated ``years`` parameter or as a range with the ``start``,
+    ``stop`` (inclusive) and ``step`` parameters. Ages are calculated at the
+    ``as_of`` date, which defaults to today.
+    """
+    try:
+        as_of = get_as_of()
+        years = get_years()
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(analytics.get_employees_percentage_older_than_average_curve,
+                    years=years, as_of=as_of)
     return make_response(
         query,
         company_name=str,
         average_employee_age=int,
+        years=float,
         percentage_older=int,
     )
 
 
+@api.route('/employees/age_quantiles')
+def employees_age_quantiles():
+    """
+    GET quantiles of the employee age per company, for the comma separated
+    ``quantiles`` (between 0 and 1). Ages are calculated at the ``as_of``
+    date, which defaults to today.
+    """
+    try:
+        as_of = get_as_of()
+        quantiles = get_floats('quantiles', DEFAULT_AGE_QUANTILES)
+        if not all(0 <= x <= 1 for x in quantiles):
+            raise ValueError('quantiles should be between 0 and 1')
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(analytics.get_age_quantiles, quantiles=quantiles, as_of=as_of)
+    return make_response(
+        query,
+        company_name=str,
+        quantile=float,
+        age=lambda x: round(float(x), 2),
+    )
+
+
+@api.route('/employees/age_distribution')
+def employees_age_distribution():
+    """
+    GET the percentage of employees per company in age groups, the comma
+    separated ``ages`` are the boundaries of the groups. Ages are calculated
+    at the ``as_of`` date, which defaults to today.
+    """
+    try:
+        as_of = get_as_of()
+        ages = tuple(sorted(set(get_floats('ages', DEFAULT_AGE_GROUPS))))
+        if len(ages) < 2:
+            raise ValueError('expected at least two ages')
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(analytics.get_age_distribution, ages=ages, as_of=as_of)
+    return make_response(
+        query,
+        company_name=str,
+        min_age=float,
+        max_age=float,
+        percentage=lambda x: round(float(x), 2),
+    )
+
+
 @api.route('/employees/percentage_by_location')
 def employees_percentage_by_location():
     """
@@ -59,9 +363,14 @@ def employees_percentage_by_location():
     min_percentage = request.args.get('min_percentage') or 0
     location = request.args.get('location') or ''
 
+    try:
+        min_percentage = parse_float(min_percentage)
+    except ValueError as e:
+        return Response(str(e), 400)
+
     if location:
 
-        query = partial(get_employees_percentage_by_location,
+        query = partial(analytics.get_employees_percentage_by_location,
                         location=location, min_percentage=min_percentage)
 
         return make_response(
@@ -74,13 +383,38 @@ def employees_percentage_by_location():
     return Response('expected location parameter', 400)
 
 
+@api.route('/employees/percentage_by_location_rollup')
+def employees_percentage_by_location_rollup():
+    """
+    GET the percentage of employees per company at every location, for all
+    levels of the location hierarchy or only for the level given by the
+    ``depth`` parameter (1 is continent, 4 is city), filtered by the
+    ``min_percentage`` parameter.
+    """
+    try:
+        min_percentage = parse_float(request.args.get('min_percentage') or 0)
+        depth = int(request.args['depth']) if request.args.get('depth') else None
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(analytics.get_employees_percentage_by_location_rollup,
+                    min_percentage=min_percentage, depth=depth)
+    return make_response(
+        query,
+        company_name=str,
+        depth=int,
+        location=str,
+        percentage=int,
+    )
+
+
 @api.route('/employees/percentage_per_job_title')
 def employees_percentage_per_job_title():
     """
     GET the percentage of employees per company with a particular job title.
     """
     return make_response(
-        get_employees_percentage_per_job_title,
+        analytics.get_employees_percentage_per_job_title,
         company_name=str,
         job_title=str,
         percentage=lambda x: round(float(x), 2),
@@ -90,21 +424,233 @@ def employees_percentage_per_job_title():
 @api.route('/employees', methods=['POST'])
 def employees_post():
     """
-    Handle uploading of a csv file with employee data.
+    Handle uploading of a csv file with employee data. The file is imported
+    in the background, the response is 202 Accepted with the status of the
+    import job, which can be followed at the url in the Location header.
+    When the ``incremental`` parameter is given only the employees that
+    changed compared to the database are written, otherwise the database is
+    replaced.
+    """
+    handle, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            request.files['file'].save(f)
+
+        load = partial(load_employees, incremental=bool(request.args.get('incremental')),
+                       logger=current_app.logger)
+        job = jobs.submit_import(database.get_engine(), path, load)
+    except Exception:
+        # once submitted the file is removed by the import job.
+        os.remove(path)
+        raise
+
+    response = json.jsonify(job.get_status())
+    response.status_code = 202
+    response.headers['Location'] = url_for('api.import_get', job_id=job.job_id)
+    return response
+
+
+def load_employees(session, fileobj, job, incremental, logger):
+    """
+    Import a csv file with employee data, this runs on an import worker.
+
+    :param session: SQLAlchemy session to import with.
+    :param fileobj: File like object to the csv data.
+    :param job: The ``ImportJob`` which is updated with the progress.
+    :param incremental: Whether only the changed employees are written.
+    :param logger: Logger for reporting the progress.
+    """
+    def progress(n_rows):
+        job.set_progress(n_rows)
+        logger.info('imported %d employees', n_rows)
+
+    workers = None
+    if os.fstat(fileobj.fileno()).st_size >= PARALLEL_PARSE_MIN_SIZE:
+        workers = PARSE_WORKERS
+
+    if incremental:
+        serializer = CsvSerializer(session, progress=progress, phase=job.set_phase,
+                                   incremental=True, workers=workers,
+                                   trace_memory=TRACE_IMPORT_MEMORY)
+    else:
+        serializer = CsvSerializer(session, chunk_size=IMPORT_CHUNK_SIZE, progress=progress,
+                                   phase=job.set_phase, staging=True, workers=workers,
+                                   trace_memory=TRACE_IMPORT_MEMORY)
+    report = serializer.load(fileobj)
+    job.set_report(report)
+    logger.info('import report %s', json.dumps(dict(report, job_id=job.job_id), sort_keys=True))
+
+    if analytics is not queries:
+        # load the new dataset now rather than on the next request
+        analytics.get_store(session)
+    result_cache.set_generation(*database.get_dataset(session))
+
+
+@api.route('/imports/<job_id>')
+def import_get(job_id):
+    """
+    GET the status of an import job: the status (queued, running, done or
+    failed), the phase of the import, the number of rows processed, the
+    rows processed per second and, once done, the report of the phases of
+    the import.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        return Response(f'unknown import {job_id}', 404)
+    return json.jsonify(job.get_status())
+
+
+def get_as_of():
+    """
+    Get the date to calculate ages at from the ``as_of`` request parameter
+    (formatted as YYYY-MM-DD), this defaults to today so results are the
+    same for the whole day.
+
+    :return: The date to calculate ages at.
+
+    :raises ValueError: If the parameter is not a valid date.
+    """
+    as_of = request.args.get('as_of')
+    if as_of:
+        return datetime.datetime.strptime(as_of, '%Y-%m-%d').date()
+    return datetime.date.today()
+
+
+def parse_float(value):
+    """
+    Parse a number from a request parameter.
+
+    :param value: The value of the parameter.
+
+    :return: The number as float.
+
+    :raises ValueError: If the value is not a finite number.
+    """
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f'invalid number {value}')
+    return number
+
+
+def get_floats(name, default=()):
+    """
+    Get the numbers from a comma separated request parameter.
+
+    :param name: The name of the parameter.
+    :param default: The numbers when the parameter is not given.
+
+    :return: tuple of numbers.
+
+    :raises ValueError: If any of the values is not a finite number.
+    """
+    if not request.args.get(name):
+        return tuple(default)
+    return tuple(parse_float(x) for x in request.args[name].split(','))
+
+
+def get_years():
+    """
+    Get the numbers of years for the older than average curve, from the
+    comma separated ``years`` request parameter, or from the range given by
+    the ``start``, ``stop`` and ``step`` request parameters.
+
+    :return: tuple of numbers of years.
+
+    :raises ValueError: If the parameters are not valid numbers or give more
+                        than ``MAX_CURVE_YEARS`` values.
+    """
+    if request.args.get('years'):
+        years = get_floats('years')
+    else:
+        start = parse_float(request.args.get('start') or 0)
+        stop = parse_float(request.args.get('stop') or start)
+        step = parse_float(request.args.get('step') or 1)
+        if not step > 0 or not stop >= start:
+            raise ValueError(f'invalid range {start}:{stop}:{step}')
+        # the number of steps is infinite when the division overflows.
+        n_steps = (stop - start) / step
+        if not n_steps < MAX_CURVE_YEARS:
+            raise ValueError(f'at most {MAX_CURVE_YEARS} years values are supported')
+        years = tuple(start + i * step for i in range(int(n_steps) + 1))
+    if len(years) > MAX_CURVE_YEARS:
+        raise ValueError(f'at most {MAX_CURVE_YEARS} years values are supported')
+    return years
+
+
+def encode_cursor(employee_id):
+    """
+    Encode the position after an employee as an opaque cursor.
+
+    :param employee_id: The id of the last employee on a page.
+
+    :return: Url safe string.
+    """
+    data = json.dumps({'employee_id': employee_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor created by ``encode_cursor``.
+
+    :param cursor: The cursor to decode.
+
+    :return: The id of the employee after which the next page starts.
+
+    :raises ValueError: If the cursor is not valid.
     """
-    fileobj = getreader('utf-8')(request.files['file'].stream)
-    with closing(database.get_session()) as session:
-        CsvSerializer(session).load(fileobj)
-    return Response(status=200)
+    try:
+        employee_id = int(json.loads(base64.urlsafe_b64decode(cursor))['employee_id'])
+    except (TypeError, KeyError, OverflowError, binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f'invalid cursor {cursor}') from e
+    # employee ids are SQLite integers, which are 64 bit.
+    if not 0 <= employee_id < 2 ** 63:
+        raise ValueError(f'invalid cursor {cursor}')
+    return employee_id
 
 
 @api.route('/employees')
 def employees_get():
     """
-    GET all the employees.
+    GET the employees. Without parameters all employees are returned. With
+    the ``limit`` parameter a page of at most ``limit`` employees (up to
+    ``MAX_PAGE_SIZE``) is returned, the ``X-Next-Cursor`` header then
+    contains the value to pass as the ``after`` parameter to get the next
+    page, it is absent on the last page. Ages are calculated at the
+    ``as_of`` date, which defaults to today.
     """
-    return make_response(
-        get_employees,
+    try:
+        as_of = get_as_of()
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    query = partial(get_employees, as_of=as_of)
+    next_cursor = None
+    cache = True
+
+    if request.args.get('limit') or request.args.get('after'):
+        try:
+            after = decode_cursor(request.args['after']) if request.args.get('after') else None
+            limit = int(request.args.get('limit') or DEFAULT_PAGE_SIZE)
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f'the limit should be between 1 and {MAX_PAGE_SIZE}')
+        except ValueError as e:
+            return Response(str(e), 400)
+
+        # retrieve one employee more than requested to find out whether there
+        # is a next page.
+        metrics.set_query(get_employees.__name__)
+        page = get_employees(database.get_session(), after, limit + 1, as_of).all()
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_cursor(page[-1].employee_id)
+        query = lambda session: page
+        cache = False
+
+    response = make_response(
+        query,
+        cache=cache,
+        query_name=get_employees.__name__,
         employee_id=int,
         job_title=str,
         continent=str,
@@ -116,17 +662,51 @@ def employees_get():
         last_name=str,
         company_name=str,
     )
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
 
 
 @api.route('/locations')
 def locations_get():
     """
-    GET all the locations.
+    GET all the locations, as / separated paths at every level of the
+    location hierarchy.
     """
     return make_response(
         get_locations,
-        continent=str,
-        country=str,
-        state=str,
-        city=str
-    )
\ No newline at end of file
+        location=str,
+    )
+
+
+@api.route('/cache')
+def cache_get():
+    """
+    GET the statistics of the result cache.
+    """
+    return json.jsonify(result_cache.get_statistics())
+
+
+# the number of query shapes listed by the slow query endpoint by default.
+DEFAULT_SLOW_QUERY_LIMIT = 10
+
+
+@api.route('/admin/slow_queries')
+def slow_queries_get():
+    """
+    GET the ``limit`` query shapes with the slowest executions since startup,
+    with execution statistics and the query plan of the slowest execution
+    over the slow query threshold. The parameters of that execution are only
+    included as types, see ``slow_queries.LOG_PARAMETERS``.
+    """
+    try:
+        limit = int(request.args.get('limit') or DEFAULT_SLOW_QUERY_LIMIT)
+        if limit < 1:
+            raise ValueError('the limit should be at least 1')
+    except ValueError as e:
+        return Response(str(e), 400)
+
+    return json.jsonify(dict(
+        threshold=slow_query_log.threshold,
+        queries=slow_query_log.get_slowest(limit),
+    ))
@@ -1,9 +1,10 @@
 # 3rd party
-from flask import Flask, send_from_directory
+from flask import Flask, Response, send_from_directory
 from flask_bootstrap import Bootstrap
 from flask_nav import Nav
 from flask_nav.elements import Navbar, View, Subgroup, Link
 # local
+from employee_insights import database, metrics
 from employee_insights.api import api
 from employee_insights.views import views
 
@@ -22,6 +23,20 @@ def serve_static(path):
     return send_from_directory('static', path)
 
 
+@app.route('/metrics')
+def metrics_get():
+    """
+    GET the request, query and connection pool metrics in the Prometheus text
+    format, for scraping by a local Prometheus server.
+    """
+    text = metrics.metrics.expose(metrics.get_pool_gauges())
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+app.teardown_appcontext(database.remove_session)
+metrics.init_app(app)
+
+
 app.register_blueprint(views)
 app.register_blueprint(api, url_prefix='/api')
 
@@ -41,7 +56,10 @@ def mynavbar():
         'Employee Insights',
         View('Home', 'views.index'),
         View('Age', 'views.age'),
+        View('Age Quantiles', 'views.age_quantiles'),
+        View('Age Distribution', 'views.age_distribution'),
         View('Location', 'views.location'),
+        View('Location Rollup', 'views.location_rollup'),
         View('Job Title', 'views.job_title'),
         Subgroup(
             'Data',
@@ -55,5 +73,8 @@ nav.init_app(app)
 
 
 if __name__ == '__main__':
+    # create the engine, connection pool and schema once at startup rather
+    # than on the first request.
+    database.get_engine()
     app.run()
 
@@ -0,0 +1,126 @@
+# std
+import os
+import time
+import threading
+import collections
+# local
+from employee_insights import database
+
+
+# seconds after which the dataset generation is read from the database again,
+# to notice imports done by other processes. Imports done by this process
+# update the generation directly, after an import by another process cached
+# results and 304 responses can be stale for this long. Set this to 0 to
+# read the generation on every request.
+GENERATION_TTL = float(os.environ.get('EMPLOYEE_INSIGHTS_GENERATION_TTL', 60))
+
+
+class ResultCache(object):
+    """
+    Least recently used cache for api results, keyed by the dataset
+    generation so results are invalidated by an import.
+
+    The generation is kept in memory, imports done by this process update it
+    directly and it is read from the database at most once per
+    ``generation_ttl`` seconds to notice imports done by other processes,
+    see ``GENERATION_TTL``. Cache hits therefore do not need the database.
+    """
+
+    def __init__(self, max_entries=256, max_entry_size=2 ** 20, generation_ttl=GENERATION_TTL):
+        """
+        :param max_entries: The maximum number of results to keep, the least
+                            recently used result is evicted when full.
+        :param max_entry_size: Results larger than this many characters are
+                               not cached.
+        :param generation_ttl: Seconds after which the generation is read
+                               from the database again.
+        """
+        self.max_entries = max_entries
+        self.max_entry_size = max_entry_size
+        self.generation_ttl = generation_ttl
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.generation = None
+        self.imported_at = None
+        self.generation_checked = 0.0
+        self.lock = threading.Lock()
+
+    def get_generation(self):
+        """
+        Get the current dataset generation.
+
+        :return: tuple of (generation, imported_at), see
+                 ``database.get_dataset``.
+        """
+        if time.monotonic() - self.generation_checked > self.generation_ttl:
+            self.set_generation(*database.get_dataset(database.get_session()))
+        return self.generation, self.imported_at
+
+    def set_generation(self, generation, imported_at):
+        """
+        Set the current dataset generation, results of previous generations
+        are evicted.
+
+        :param generation: The dataset generation.
+        :param imported_at: The time the dataset was imported.
+        """
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+            self.generation = generation
+            self.imported_at = imported_at
+            self.generation_checked = time.monotonic()
+
+    def get(self, key):
+        """
+        Get a cached result.
+
+        :param key: Key of the result, which should include the generation.
+
+        :return: The cached result or None if not cached.
+        """
+        with self.lock:
+            result = self.entries.get(key)
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return result
+
+    def set(self, key, result):
+        """
+        Cache a result, evicting the least recently used result when the
+        cache is full.
+
+        :param key: Key of the result, which should include the generation.
+        :param result: The result to cache.
+        """
+        if len(result) > self.max_entry_size:
+            return
+        with self.lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all cached results, the generation is read from the database
+        on the next request.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.generation_checked = 0.0
+
+    def get_statistics(self):
+        """
+        Get the cache statistics.
+
+        :return: dict with the number of hits, misses and cached results and
+                 the current generation.
+        """
+        with self.lock:
+            return dict(hits=self.hits, misses=self.misses,
+                        entries=len(self.entries), generation=self.generation)
@@ -0,0 +1,439 @@
+"""
+In-memory columnar backend for the analytics queries.
+
+The employees are loaded into NumPy arrays once per dataset generation, with
+the companies, job titles and location paths dictionary encoded as integer
+codes. The analytics are then answered with vectorized reductions over these
+arrays instead of SQL. The functions in this module have the same signature
+and give the same columns as the functions of the same name in
+``employee_insights.queries``, so either can be used by the api.
+
+Results are lists of named tuples ordered by company id (and job title id).
+"""
+# std
+import datetime
+import threading
+import collections
+import weakref
+# 3rd party
+from sqlalchemy import select
+try:
+    import numpy
+except ImportError:  # only required when this backend is used
+    numpy = None
+# local
+from employee_insights import database
+from employee_insights.models import Employee, Company, JobTitle, LocationPath
+
+
+# rows with the same columns as the corresponding sql queries
+EmployeesPerCompany = collections.namedtuple('EmployeesPerCompany', [
+    'company_id',
+    'total',
+])
+CompanyStatistics = collections.namedtuple('CompanyStatistics', [
+    'company_id',
+    'average_employee_age',
+])
+PercentageOlderThanAverage = collections.namedtuple('PercentageOlderThanAverage', [
+    'company_id',
+    'company_name',
+    'average_employee_age',
+    'percentage_older',
+])
+PercentageOlderThanAverageCurve = collections.namedtuple('PercentageOlderThanAverageCurve', [
+    'company_id',
+    'company_name',
+    'average_employee_age',
+    'years',
+    'percentage_older',
+])
+AgeQuantile = collections.namedtuple('AgeQuantile', [
+    'company_id',
+    'company_name',
+    'quantile',
+    'age',
+])
+AgeDistribution = collections.namedtuple('AgeDistribution', [
+    'company_id',
+    'company_name',
+    'min_age',
+    'max_age',
+    'percentage',
+])
+PercentageByLocation = collections.namedtuple('PercentageByLocation', [
+    'company_id',
+    'company_name',
+    'location',
+    'percentage',
+])
+PercentageByLocationRollup = collections.namedtuple('PercentageByLocationRollup', [
+    'company_id',
+    'company_name',
+    'depth',
+    'location',
+    'percentage',
+])
+PercentagePerJobTitle = collections.namedtuple('PercentagePerJobTitle', [
+    'company_id',
+    'company_name',
+    'job_title_id',
+    'job_title',
+    'percentage',
+])
+
+
+# the loaded stores per engine, with the generation they were loaded at
+stores = weakref.WeakKeyDictionary()
+stores_lock = threading.Lock()
+
+
+class EmployeeStore(object):
+    """
+    The employees of a dataset as columns. Employees are sorted by company
+    and then by date of birth, so the employees of a company are the slice
+    ``offsets[i]:offsets[i + 1]`` with the oldest employee first.
+    """
+
+    def __init__(self, session):
+        """
+        :param session: SQLAlchemy session to load the employees with.
+        """
+        employee = Employee.__table__
+        rows = session.execute(
+            select([employee.c.company_id, employee.c.job_title_id,
+                    employee.c.location_id, employee.c.date_of_birth_day])
+            .order_by(employee.c.company_id, employee.c.date_of_birth_day)
+        ).fetchall()
+        columns = numpy.array(rows, dtype=numpy.int64).reshape(-1, 4).T
+        company_id, job_title_id, location_id, self.date_of_birth_day = columns
+
+        # only companies with employees, as in the statistics tables
+        self.company_ids = numpy.unique(company_id)
+        self.company_code = numpy.searchsorted(self.company_ids, company_id)
+        self.offsets = numpy.append(numpy.searchsorted(company_id, self.company_ids), len(rows))
+        self.employee_count = numpy.diff(self.offsets)
+        self.date_of_birth_sum = numpy.zeros(len(self.company_ids), dtype=numpy.int64)
+        if len(rows):
+            self.date_of_birth_sum = numpy.add.reduceat(self.date_of_birth_day, self.offsets[:-1])
+
+        # the employees sorted by a single key combining company and date of
+        # birth, so a date of birth can be looked up in every company at once.
+        self.min_day = int(self.date_of_birth_day.min()) if len(rows) else 0
+        self.day_span = int(self.date_of_birth_day.max()) - self.min_day + 2 if len(rows) else 1
+        self.company_day_key = self.company_code * self.day_span + (self.date_of_birth_day - self.min_day)
+
+        company_names = dict(session.query(Company.company_id, Company.company_name))
+        self.company_names = [company_names[x] for x in self.company_ids.tolist()]
+
+        self.job_title_ids = numpy.unique(job_title_id)
+        self.job_title_code = numpy.searchsorted(self.job_title_ids, job_title_id)
+        job_titles = dict(session.query(JobTitle.job_title_id, JobTitle.job_title))
+        self.job_titles = [job_titles[x] for x in self.job_title_ids.tolist()]
+
+        # the code of the path at every depth of the location of an employee,
+        # see ``LocationPath``.
+        location_paths = session.query(LocationPath.depth, LocationPath.location_id, LocationPath.path).all()
+        size = max([x for _, x, _ in location_paths] + location_id.tolist(), default=0) + 1
+        self.path_codes = collections.defaultdict(dict)
+        location_codes = collections.defaultdict(lambda: numpy.full(size, -1, dtype=numpy.int64))
+        for depth, path_location_id, path in location_paths:
+            codes = self.path_codes[depth]
+            location_codes[depth][path_location_id] = codes.setdefault(path, len(codes))
+        self.path_code = {depth: x[location_id] for depth, x in location_codes.items()}
+
+    def count_born_before(self, days):
+        """
+        Count the employees per company born before a day.
+
+        :param days: Array with a (possibly fractional) day number per company,
+                     or with a row of day numbers per company.
+
+        :return: Array with the number of employees per company born before
+                 the day of the company, with the same shape as ``days``.
+        """
+        days = numpy.nan_to_num(numpy.ceil(days) - self.min_day, nan=0.0)
+        days = numpy.clip(days, 0, self.day_span - 1).astype(numpy.int64)
+        company_code = numpy.arange(len(self.company_ids)).reshape((-1,) + (1,) * (days.ndim - 1))
+        keys = company_code * self.day_span + days
+        offsets = self.offsets[:-1].reshape(company_code.shape)
+        return numpy.searchsorted(self.company_day_key, keys, 'left') - offsets
+
+    @property
+    def average_date_of_birth_day(self):
+        return 1.0 * self.date_of_birth_sum / self.employee_count
+
+
+def get_store(session):
+    """
+    Get the employee store for the database of a session, the store is
+    loaded again when the dataset generation has changed since it was
+    loaded.
+
+    :param session: SQLAlchemy session of the database.
+
+    :return: ``EmployeeStore`` of the current dataset.
+    """
+    if numpy is None:
+        raise ImportError('the numpy analytics backend requires numpy')
+
+    engine = session.get_bind()
+    generation, _ = database.get_dataset(session)
+    with stores_lock:
+        store_generation, store = stores.get(engine, (None, None))
+        if store_generation != generation:
+            store = EmployeeStore(session)
+            stores[engine] = generation, store
+    return store
+
+
+def get_as_of_day(as_of=None):
+    """
+    Get the day number to calculate ages at, the same as ``get_age`` does
+    in SQL.
+
+    :param as_of: The date to calculate the ages at, when not given the
+                  current (UTC) time is used.
+
+    :return: Day number, fractional when ``as_of`` is not given.
+    """
+    if as_of is None:
+        now = datetime.datetime.utcnow()
+        midnight = datetime.datetime.combine(now.date(), datetime.time())
+        return now.toordinal() + (now - midnight).total_seconds() / 86400
+    return as_of.toordinal()
+
+
+def get_employees_per_company(session):
+    """
+    Get the number of employees per company.
+
+    :param session: SQLAlchemy session of the database.
+
+    :return: list of ``EmployeesPerCompany``.
+    """
+    store = get_store(session)
+    return list(map(EmployeesPerCompany,
+                    store.company_ids.tolist(),
+                    store.employee_count.tolist()))
+
+
+def get_company_statistics(session, as_of=None):
+    """
+    Get the average employee age per company.
+
+    :param session: SQLAlchemy session of the database.
+    :param as_of: The date to calculate the ages at.
+
+    :return: list of ``CompanyStatistics``.
+    """
+    store = get_store(session)
+    average_employee_age = (get_as_of_day(as_of) - store.average_date_of_birth_day) / 365.25
+    return list(map(CompanyStatistics,
+                    store.company_ids.tolist(),
+                    average_employee_age.tolist()))
+
+
+def get_employees_percentage_older_than_average(session, years, as_of=None):
+    """
+    Get the percentage of the employees per company that are ``years`` older
+    than the company-wide average.
+
+    The employees of a company are sorted by date of birth, so the number of
+    older employees is a binary search per company, see
+    ``EmployeeStore.count_born_before``.
+
+    :param session: SQLAlchemy session of the database.
+    :param years: This many years older than the company-wide average.
+    :param as_of: The date to calculate the average age at.
+
+    :return: list of ``PercentageOlderThanAverage``.
+    """
+    store = get_store(session)
+    average_day = store.average_date_of_birth_day
+    threshold = average_day - float(years) * 365.25
+
+    percentage_older = 100.0 * store.count_born_before(threshold) / store.employee_count
+    average_employee_age = (get_as_of_day(as_of) - average_day) / 365.25
+
+    return list(map(PercentageOlderThanAverage,
+                    store.company_ids.tolist(),
+                    store.company_names,
+                    average_employee_age.tolist(),
+                    percentage_older.tolist()))
+
+
+def get_employees_percentage_older_than_average_curve(session, years, as_of=None):
+    """
+    Get the percentage of the employees per company that are older than the
+    company-wide average for several numbers of years at once, with one
+    binary search per company and number of years.
+
+    :param session: SQLAlchemy session of the database.
+    :param years: Sequence of numbers of years older than the company-wide
+                  average.
+    :param as_of: The date to calculate the average age at.
+
+    :return: list of ``PercentageOlderThanAverageCurve`` for every company and
+             each of ``years``, ordered by company id.
+    """
+    store = get_store(session)
+    average_day = store.average_date_of_birth_day
+    thresholds = average_day[:, None] - numpy.array(years, dtype=float)[None, :] * 365.25
+
+    percentage_older = 100.0 * store.count_born_before(thresholds) / store.employee_count[:, None]
+    average_employee_age = (get_as_of_day(as_of) - average_day) / 365.25
+
+    return [
+        PercentageOlderThanAverageCurve(company_id, company_name, age, n_years, percentage)
+        for company_id, company_name, age, percentages in zip(
+            store.company_ids.tolist(), store.company_names,
+            average_employee_age.tolist(), percentage_older.tolist())
+        for n_years, percentage in zip(years, percentages)
+    ]
+
+
+def get_age_quantiles(session, quantiles, as_of=None):
+    """
+    Get quantiles of the employee age per company, interpolated linearly
+    between the two closest ages.
+
+    :param session: SQLAlchemy session of the database.
+    :param quantiles: Sequence of quantiles between 0 and 1.
+    :param as_of: The date to calculate the ages at.
+
+    :return: list of ``AgeQuantile`` for every company and each of
+             ``quantiles``, ordered by company id.
+    """
+    store = get_store(session)
+    last = store.employee_count[:, None] - 1
+    first = store.offsets[:-1, None]
+
+    # the employees are ordered oldest first, so by descending age
+    index = last * (1.0 - numpy.array(quantiles, dtype=float)[None, :])
+    lower = index.astype(numpy.int64)
+    lower_day = store.date_of_birth_day[first + lower]
+    upper_day = store.date_of_birth_day[first + numpy.minimum(lower + 1, last)]
+    day = lower_day + (upper_day - lower_day) * (index - lower)
+    age = (get_as_of_day(as_of) - day) / 365.25
+
+    return [
+        AgeQuantile(company_id, company_name, quantile, quantile_age)
+        for company_id, company_name, ages in zip(
+            store.company_ids.tolist(), store.company_names, age.tolist())
+        for quantile, quantile_age in zip(quantiles, ages)
+    ]
+
+
+def get_age_distribution(session, ages, as_of=None):
+    """
+    Get the percentage of the employees per company in age groups, see
+    ``employee_insights.queries.get_age_distribution``.
+
+    :param session: SQLAlchemy session of the database.
+    :param ages: Ascending sequence of ages which are the boundaries of the
+                 age groups.
+    :param as_of: The date to calculate the ages at.
+
+    :return: list of ``AgeDistribution`` for every company and each pair of
+             consecutive ``ages``, ordered by company id.
+    """
+    store = get_store(session)
+    days = get_as_of_day(as_of) - numpy.array(ages, dtype=float) * 365.25
+    n_older = store.count_born_before(numpy.tile(days, (len(store.company_ids), 1)))
+    percentage = 100.0 * (n_older[:, :-1] - n_older[:, 1:]) / store.employee_count[:, None]
+
+    return [
+        AgeDistribution(company_id, company_name, min_age, max_age, group_percentage)
+        for company_id, company_name, percentages in zip(
+            store.company_ids.tolist(), store.company_names, percentage.tolist())
+        for min_age, max_age, group_percentage in zip(ages, ages[1:], percentages)
+    ]
+
+
+def get_employees_percentage_by_location(session, location, min_percentage):
+    """
+    Get the percentage of the employees of a company at a particular
+    location, filtered by a minimum percentage of employees.
+
+    :param session: SQLAlchemy session of the database.
+    :param location: The / separated location, see
+                     ``employee_insights.queries.get_employees_percentage_by_location``.
+    :param min_percentage: The minimum percentage to filter the results by.
+
+    :return: list of ``PercentageByLocation``.
+    """
+    store = get_store(session)
+    depth = len(location.split('/'))
+    code = store.path_codes.get(depth, {}).get(location)
+    if code is None:
+        return []
+
+    in_location = store.path_code[depth] == code
+    counts = numpy.bincount(store.company_code[in_location], minlength=len(store.company_ids))
+    percentage = 1.0 * counts / store.employee_count * 100
+
+    selected = numpy.flatnonzero((counts > 0) & (percentage > float(min_percentage)))
+    return [
+        PercentageByLocation(store.company_ids[i].item(), store.company_names[i],
+                             location, percentage[i].item())
+        for i in selected.tolist()
+    ]
+
+
+def get_employees_percentage_by_location_rollup(session, min_percentage, depth=None):
+    """
+    Get the percentage of the employees of a company at every location, at
+    every level of the location hierarchy, filtered by a minimum percentage
+    of employees.
+
+    :param session: SQLAlchemy session of the database.
+    :param min_percentage: The minimum percentage to filter the results by.
+    :param depth: When given only the locations at this level are retrieved.
+
+    :return: list of ``PercentageByLocationRollup`` ordered by company, depth
+             and location.
+    """
+    store = get_store(session)
+
+    result = []
+    for path_depth in sorted(store.path_code):
+        if depth is not None and path_depth != depth:
+            continue
+        paths = sorted(store.path_codes[path_depth], key=store.path_codes[path_depth].get)
+        n_paths = len(paths)
+        keys, counts = numpy.unique(store.company_code * n_paths + store.path_code[path_depth],
+                                    return_counts=True)
+        company_code, path_code = numpy.divmod(keys, max(n_paths, 1))
+        percentage = 1.0 * counts / store.employee_count[company_code] * 100
+        result += [
+            PercentageByLocationRollup(store.company_ids[c].item(), store.company_names[c],
+                                       path_depth, paths[l], p)
+            for c, l, p in zip(company_code.tolist(), path_code.tolist(), percentage.tolist())
+            if p > float(min_percentage)
+        ]
+
+    return sorted(result, key=lambda x: (x.company_id, x.depth, x.location))
+
+
+def get_employees_percentage_per_job_title(session):
+    """
+    Get the percentage of the employees per company that have a particular
+    job title.
+
+    :param session: SQLAlchemy session of the database.
+
+    :return: list of ``PercentagePerJobTitle``.
+    """
+    store = get_store(session)
+    n_job_titles = len(store.job_title_ids)
+    keys, counts = numpy.unique(store.company_code * n_job_titles + store.job_title_code,
+                                return_counts=True)
+    company_code, job_title_code = numpy.divmod(keys, max(n_job_titles, 1))
+    percentage = 1.0 * counts / store.employee_count[company_code] * 100
+
+    return [
+        PercentagePerJobTitle(store.company_ids[c].item(), store.company_names[c],
+                              store.job_title_ids[j].item(), store.job_titles[j], p)
+        for c, j, p in zip(company_code.tolist(), job_title_code.tolist(), percentage.tolist())
+    ]
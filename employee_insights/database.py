@@ -1,11 +1,14 @@
 # std
 import os
+import datetime
+from contextlib import closing
 __dir__ = os.path.dirname(__file__)
 # 3rd party
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, MetaData, Table, Column, ForeignKey, Index
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool, StaticPool
 # local
-from employee_insights.models import Base
+from employee_insights.models import Base, Dataset
 
 
 database_path = os.path.join(__dir__, '..', 'employee_insights.db')
@@ -13,17 +16,254 @@ get_url = lambda: f'sqlite:///{database_path}'
 import_data = None
 
 
+# pool settings for file based databases, these can be overridden per
+# deployment through the environment.
+pool_options = dict(
+    pool_size=int(os.environ.get('EMPLOYEE_INSIGHTS_POOL_SIZE', 5)),
+    max_overflow=int(os.environ.get('EMPLOYEE_INSIGHTS_POOL_MAX_OVERFLOW', 10)),
+    pool_timeout=int(os.environ.get('EMPLOYEE_INSIGHTS_POOL_TIMEOUT', 30)),
+)
+
+
+engines = {}
+Session = scoped_session(sessionmaker())
+
+
+def is_memory_url(url):
+    """
+    Check whether a SQLAlchemy url refers to an in-memory SQLite database.
+
+    :param url: SQLAlchemy url.
+
+    :return: True if the url is for an in-memory database.
+    """
+    return url in ('sqlite://', 'sqlite:///:memory:')
+
+
+def enable_write_ahead_log(dbapi_connection, connection_record):
+    """
+    Put SQLite in write ahead log mode, so readers are not blocked by an
+    import that is writing to the database.
+
+    :param dbapi_connection: The SQLite connection that was opened.
+    :param connection_record: The pool record of the connection.
+    """
+    dbapi_connection.execute('pragma journal_mode=wal')
+
+
+def create_schema(engine):
+    """
+    Create the employee insights schema, this only needs to be done once per
+    database (at startup, or as an explicit migration step).
+
+    :param engine: SQLAlchemy engine to create the schema for.
+    """
+    Base.metadata.create_all(engine)
+
+
+def get_engine(url=None):
+    """
+    Get the engine for a database url, creating it (and the schema) the first
+    time the url is requested. Engines are cached for the lifetime of the
+    process so connections are pooled between requests.
+
+    :param url: SQLAlchemy url, defaults to the result of ``get_url``.
+
+    :return: SQLAlchemy engine.
+    """
+    url = url or get_url()
+    if url not in engines:
+        if is_memory_url(url):
+            # an in-memory database only exists for a single connection, so
+            # this connection must be shared between all threads.
+            engine = create_engine(url, poolclass=StaticPool,
+                                   connect_args={'check_same_thread': False})
+        else:
+            # pooled connections are used by the thread that checked these
+            # out, which is not necessarily the thread that created them.
+            engine = create_engine(url, poolclass=QueuePool,
+                                   connect_args={'check_same_thread': False},
+                                   **pool_options)
+            event.listen(engine, 'connect', enable_write_ahead_log)
+        create_schema(engine)
+        if import_data:
+            with closing_session(engine) as session:
+                import_data(session)
+        engines[url] = engine
+    return engines[url]
+
+
+def closing_session(engine):
+    """
+    Create a new session bound to ``engine`` which is not part of the request
+    scope, to be used as a context manager.
+
+    :param engine: SQLAlchemy engine to bind the session to.
+
+    :return: Context manager yielding the session and closing it on exit.
+    """
+    return closing(sessionmaker(bind=engine)())
+
+
 def get_session():
     """
-    Get a SQLAlchemy session for interacting with the employee insights
-    database.
+    Get the SQLAlchemy session for interacting with the employee insights
+    database. The session is scoped, so the same session is returned until
+    ``remove_session`` is called at the end of the request.
 
     :return: SQLAlchemy session.
     """
-    engine = create_engine(get_url())
-    Base.metadata.create_all(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-    if import_data:
-        import_data(session)
-    return session
+    if not Session.registry.has():
+        Session.configure(bind=get_engine())
+    return Session()
+
+
+def remove_session(exception=None):
+    """
+    Close the scoped session and return its connection to the pool. This is
+    registered as a teardown function on the Flask application.
+
+    :param exception: Exception that caused the teardown, if any.
+    """
+    Session.remove()
+
+
+def dispose_engines():
+    """
+    Dispose of all cached engines, the next call to ``get_engine`` will
+    create the engine and schema again.
+    """
+    Session.remove()
+    for engine in engines.values():
+        engine.dispose()
+    engines.clear()
+
+
+def create_staging_tables(session, suffix):
+    """
+    Create an empty copy of every table in the schema, named
+    ``<table>_<suffix>``, to load a new dataset into without touching the
+    tables that are being read.
+
+    Foreign keys refer to the other staging tables, SQLite rewrites these
+    references when the staging tables are renamed by
+    ``swap_staging_tables``.
+
+    :param session: SQLAlchemy session to create the tables with.
+    :param suffix: Suffix for the table and index names, which keeps these
+                   unique.
+
+    :return: dict of live table to staging table.
+    """
+    metadata = MetaData()
+    tables = [x for x in Base.metadata.sorted_tables if x is not Dataset.__table__]
+    names = {x.name: f'{x.name}_{suffix}' for x in tables}
+
+    staging_tables = {}
+    for table in tables:
+        columns = [
+            Column(column.name, column.type,
+                   *(ForeignKey(f'{names[x.column.table.name]}.{x.column.name}')
+                     for x in column.foreign_keys),
+                   primary_key=column.primary_key,
+                   autoincrement=column.autoincrement)
+            for column in table.columns
+        ]
+        staging_table = Table(names[table.name], metadata, *columns, **table.kwargs)
+        for index in table.indexes:
+            Index(f'{index.name}_{suffix}',
+                  *(staging_table.c[x.name] for x in index.columns),
+                  unique=index.unique)
+        staging_tables[table] = staging_table
+
+    metadata.create_all(session.connection())
+    session.commit()
+    return staging_tables
+
+
+def swap_staging_tables(session, staging_tables, timestamp=None):
+    """
+    Replace the live tables by the staging tables in a single transaction,
+    readers see either the previous or the new dataset but never a partial
+    one. The dataset generation is incremented in the same transaction.
+
+    :param session: SQLAlchemy session to perform the swap with.
+    :param staging_tables: dict of live table to staging table, as returned
+                           by ``create_staging_tables``.
+    :param timestamp: The timestamp the ages of the new dataset pertain to,
+                      see ``increment_generation``.
+    """
+    # the sqlite driver only starts a transaction before data modification
+    # statements, start it explicitly so the ddl below is atomic.
+    session.execute('begin immediate')
+    for table in staging_tables:
+        session.execute(f'drop table if exists {table.name}')
+    for table, staging_table in staging_tables.items():
+        session.execute(f'alter table {staging_table.name} rename to {table.name}')
+    increment_generation(session, timestamp)
+    session.commit()
+
+
+def drop_staging_tables(session, staging_tables):
+    """
+    Drop the staging tables, for cleaning up after a failed import.
+
+    :param session: SQLAlchemy session to drop the tables with.
+    :param staging_tables: dict of live table to staging table, as returned
+                           by ``create_staging_tables``.
+    """
+    session.rollback()
+    for staging_table in staging_tables.values():
+        session.execute(f'drop table if exists {staging_table.name}')
+    session.commit()
+
+
+def get_dataset(session):
+    """
+    Get the generation and import time of the dataset in the database.
+
+    :param session: SQLAlchemy session to query the dataset with.
+
+    :return: tuple of (generation, imported_at), the generation is 0 and the
+             import time None when nothing was imported yet. The import time
+             is a timezone aware datetime in UTC.
+    """
+    dataset = session.query(Dataset.generation, Dataset.imported_at).first()
+    if not dataset:
+        return 0, None
+    generation, imported_at = dataset
+    # SQLite stores the time without its timezone, which is always UTC.
+    if imported_at is not None:
+        imported_at = imported_at.replace(tzinfo=datetime.timezone.utc)
+    return generation, imported_at
+
+
+def get_timestamp(session):
+    """
+    Get the timestamp the ages of the dataset in the database pertain to.
+
+    :param session: SQLAlchemy session to query the dataset with.
+
+    :return: The timestamp given for the last full import, or None when
+             nothing was imported yet.
+    """
+    return session.query(Dataset.timestamp).scalar()
+
+
+def increment_generation(session, timestamp=None):
+    """
+    Increment the dataset generation and set the import time, this should
+    be done in the transaction which commits an import.
+
+    :param session: SQLAlchemy session to update the generation with.
+    :param timestamp: The timestamp the ages of the imported csv file pertain
+                      to, when not given the previous timestamp is kept.
+    """
+    table = Dataset.__table__
+    imported_at = datetime.datetime.now(datetime.timezone.utc)
+    values = dict(imported_at=imported_at)
+    if timestamp is not None:
+        values['timestamp'] = timestamp
+    updated = session.execute(table.update().values(generation=table.c.generation + 1, **values))
+    if not updated.rowcount:
+        session.execute(table.insert().values(dataset_id=1, generation=1, **values))
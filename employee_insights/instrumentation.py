@@ -0,0 +1,114 @@
+# std
+import time
+import tracemalloc
+import collections
+
+
+class LoadReport(object):
+    """
+    Wall time, rows per second and peak allocated memory of the phases of a
+    load by ``CsvSerializer``, together with the number of rows loaded and
+    the cardinality of the dimensions. Phases which are entered more than
+    once, as when loading in chunks, are added up.
+
+    The peak allocated memory is only measured while ``tracemalloc`` is
+    tracing, which slows down the load considerably, see the
+    ``trace_memory`` option of ``CsvSerializer``.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.phase = None
+        self.phase_started_at = None
+        self.seconds = collections.OrderedDict()
+        self.peak_memory = {}
+        # time spent on parts of the parse phase, see ``add_time``
+        self.parse_seconds = collections.defaultdict(float)
+        self.rows = 0
+        self.dimensions = {}
+
+    def enter(self, phase):
+        """
+        Start measuring a phase, ending the measurement of the current phase.
+
+        :param phase: The name of the phase, one of
+                      ``employee_insights.serializer.PHASES``.
+        """
+        now = time.perf_counter()
+        self._leave(now)
+        self.phase = phase
+        self.phase_started_at = now
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    def add_time(self, name, seconds):
+        """
+        Add time spent on a part of the parse phase, the remainder of the
+        parse phase is reported as ``encode``.
+
+        :param name: The name of the part, ``read`` or ``date_of_birth``.
+        :param seconds: The time spent.
+        """
+        self.parse_seconds[name] += seconds
+
+    def finish(self, rows, dimensions):
+        """
+        End the measurement of the current phase and of the load.
+
+        :param rows: The number of employees loaded.
+        :param dimensions: dict of the number of rows per dimension.
+        """
+        self.finished_at = time.perf_counter()
+        self._leave(self.finished_at)
+        self.phase = None
+        self.rows = rows
+        self.dimensions = dimensions
+
+    def _leave(self, now):
+        """
+        :param now: The time the current phase ended.
+        """
+        if self.phase is None:
+            return
+        self.seconds[self.phase] = self.seconds.get(self.phase, 0.0) + now - self.phase_started_at
+        if tracemalloc.is_tracing():
+            _, peak = tracemalloc.get_traced_memory()
+            self.peak_memory[self.phase] = max(self.peak_memory.get(self.phase, 0), peak)
+
+    def _get_rate(self, seconds):
+        return round(self.rows / seconds, 1) if seconds else None
+
+    def as_dict(self):
+        """
+        :return: dict with the number of rows, the total seconds, rows per
+                 second and peak allocated memory in bytes (None when not
+                 traced), a list of the same for every phase, the time spent
+                 reading csv records, calculating dates of birth and encoding
+                 dimensions in the parse phase, and the dimension
+                 cardinalities.
+        """
+        seconds = (self.finished_at or time.perf_counter()) - self.started_at
+        phases = [
+            dict(
+                phase=phase,
+                seconds=round(phase_seconds, 3),
+                rows_per_second=self._get_rate(phase_seconds),
+                peak_memory=self.peak_memory.get(phase),
+            )
+            for phase, phase_seconds in self.seconds.items()
+        ]
+        parse = dict(
+            read=self.parse_seconds['read'],
+            date_of_birth=self.parse_seconds['date_of_birth'],
+        )
+        parse['encode'] = max(self.seconds.get('parse', 0.0) - sum(parse.values()), 0.0)
+        return dict(
+            rows=self.rows,
+            seconds=round(seconds, 3),
+            rows_per_second=self._get_rate(seconds),
+            peak_memory=max(self.peak_memory.values()) if self.peak_memory else None,
+            phases=phases,
+            parse={name: round(value, 3) for name, value in parse.items()},
+            dimensions=self.dimensions,
+        )
@@ -0,0 +1,147 @@
+# std
+import os
+import time
+import uuid
+import logging
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+# local
+from employee_insights import database
+
+
+logger = logging.getLogger(__name__)
+
+
+# the number of imports that run at the same time, further imports wait in a
+# queue. SQLite allows only a single writer, so by default imports run one at
+# a time.
+IMPORT_WORKERS = int(os.environ.get('EMPLOYEE_INSIGHTS_IMPORT_WORKERS', 1))
+
+# the number of finished jobs of which the status is kept.
+MAX_FINISHED_JOBS = 100
+
+
+executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS)
+jobs = collections.OrderedDict()
+jobs_lock = threading.Lock()
+
+
+class ImportJob(object):
+    """
+    The status of an import that runs in the background.
+    """
+
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.phase = None
+        self.rows = 0
+        self.error = None
+        self.report = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def set_phase(self, phase):
+        """
+        :param phase: The phase the import entered, see
+                      ``employee_insights.serializer.PHASES``.
+        """
+        self.phase = phase
+
+    def set_progress(self, n_rows):
+        """
+        :param n_rows: The number of rows processed so far.
+        """
+        self.rows = n_rows
+
+    def set_report(self, report):
+        """
+        :param report: The report of the import, see
+                       ``employee_insights.serializer.CsvSerializer.load``.
+        """
+        self.report = report
+
+    def get_status(self):
+        """
+        Get the status of the job.
+
+        :return: dict with the status, phase, number of rows processed,
+                 seconds the import is running, rows processed per second
+                 and the report of the import when done.
+        """
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return dict(
+            job_id=self.job_id,
+            status=self.status,
+            phase=self.phase,
+            rows=self.rows,
+            elapsed=round(elapsed, 3),
+            rows_per_second=round(self.rows / elapsed, 1) if elapsed else 0.0,
+            error=self.error,
+            report=self.report,
+        )
+
+
+def submit_import(engine, path, load):
+    """
+    Queue an import of a csv file.
+
+    :param engine: SQLAlchemy engine of the database to import into.
+    :param path: Path of the csv file, which is removed after the import.
+    :param load: Callable which performs the import, called with a session,
+                 the open csv file and the ``ImportJob``.
+
+    :return: The ``ImportJob`` of the import.
+    """
+    job = ImportJob()
+    with jobs_lock:
+        jobs[job.job_id] = job
+        finished = [x for x in jobs.values() if x.finished]
+        for x in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del jobs[x.job_id]
+    executor.submit(run_import, job, engine, path, load)
+    return job
+
+
+def run_import(job, engine, path, load):
+    """
+    Run an import, this is done on a worker thread of ``executor``.
+
+    :param job: The ``ImportJob`` of the import.
+    :param engine: SQLAlchemy engine of the database to import into.
+    :param path: Path of the csv file, which is removed after the import.
+    :param load: Callable which performs the import, see ``submit_import``.
+    """
+    job.status = 'running'
+    job.started_at = time.time()
+    status = 'done'
+    try:
+        with open(path, encoding='utf-8', newline='') as fileobj, \
+             database.closing_session(engine) as session:
+            load(session, fileobj, job)
+    except Exception as e:
+        logger.exception('import %s failed', job.job_id)
+        job.error = str(e)
+        status = 'failed'
+    finally:
+        os.remove(path)
+        job.finished_at = time.time()
+        job.status = status
+
+
+def get_job(job_id):
+    """
+    :param job_id: The id of the job.
+
+    :return: The ``ImportJob`` or None if there is no such job.
+    """
+    with jobs_lock:
+        return jobs.get(job_id)
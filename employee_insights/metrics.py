@@ -0,0 +1,277 @@
+# std
+import time
+import bisect
+import threading
+import collections
+# 3rd party
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+# local
+from employee_insights import database
+from employee_insights.slow_queries import slow_query_log
+
+
+# the upper bounds in seconds of the buckets of the latency histograms.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+# the type and description of every metric, in the order these are exposed.
+METRICS = collections.OrderedDict([
+    ('employee_insights_requests_total',
+     ('counter', 'Number of requests per endpoint, method and status.')),
+    ('employee_insights_request_duration_seconds',
+     ('histogram', 'Time until the response, including streaming, was complete.')),
+    ('employee_insights_serialization_duration_seconds',
+     ('histogram', 'Time spent encoding the records of a json response.')),
+    ('employee_insights_query_duration_seconds',
+     ('histogram', 'Time of the sql statements executed per query function.')),
+    ('employee_insights_query_rows_total',
+     ('counter', 'Number of records returned per query function.')),
+    ('employee_insights_pool_size',
+     ('gauge', 'Number of connections kept in the connection pool.')),
+    ('employee_insights_pool_max_overflow',
+     ('gauge', 'Number of connections that can be opened beyond the pool size.')),
+    ('employee_insights_pool_checked_out',
+     ('gauge', 'Number of connections in use.')),
+    ('employee_insights_pool_saturation',
+     ('gauge', 'Connections in use as a fraction of the maximum number of connections.')),
+])
+
+
+class Histogram(object):
+    """
+    Counts of observed values per bucket, together with the number and sum
+    of the observed values.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        """
+        :param buckets: Sorted upper bounds of the buckets, values larger than
+                        the last bound are counted in an implicit +Inf bucket.
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        :param value: The value to count.
+        """
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def get_cumulative_counts(self):
+        """
+        :return: list of tuples of (upper bound, number of values smaller
+                 than or equal to the bound), the last bound is '+Inf'.
+        """
+        bounds = [repr(float(x)) for x in self.buckets] + ['+Inf']
+        cumulative, total = [], 0
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+
+class Metrics(object):
+    """
+    The counters and histograms of the application, keyed by metric name and
+    labels, exposed in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.counters = collections.defaultdict(collections.Counter)
+        self.histograms = collections.defaultdict(dict)
+        self.lock = threading.Lock()
+
+    def increment(self, name, labels, value=1):
+        """
+        :param name: The name of the counter, one of ``METRICS``.
+        :param labels: dict of label names and values.
+        :param value: The value to add to the counter.
+        """
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[name][labels] += value
+
+    def observe(self, name, labels, value):
+        """
+        :param name: The name of the histogram, one of ``METRICS``.
+        :param labels: dict of label names and values.
+        :param value: The value to count.
+        """
+        labels = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].get(labels)
+            if histogram is None:
+                histogram = self.histograms[name][labels] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        """
+        Remove all counters and histograms.
+        """
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def expose(self, gauges=None):
+        """
+        Get the metrics in the Prometheus text exposition format.
+
+        :param gauges: dict of gauge name to a list of tuples of (labels,
+                       value), which are measured when exposed.
+
+        :return: str with the metrics.
+        """
+        gauges = gauges or {}
+        lines = []
+        with self.lock:
+            for name, (metric_type, description) in METRICS.items():
+                lines.append(f'# HELP {name} {description}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                if metric_type == 'counter':
+                    for labels, value in sorted(self.counters[name].items()):
+                        lines.append(f'{name}{format_labels(labels)} {value}')
+                elif metric_type == 'histogram':
+                    for labels, histogram in sorted(self.histograms[name].items()):
+                        for bound, count in histogram.get_cumulative_counts():
+                            bucket_labels = labels + (('le', bound),)
+                            lines.append(f'{name}_bucket{format_labels(bucket_labels)} {count}')
+                        lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum!r}')
+                        lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+                else:
+                    for labels, value in gauges.get(name, ()):
+                        labels = tuple(sorted(labels.items()))
+                        lines.append(f'{name}{format_labels(labels)} {value!r}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    """
+    :param labels: Sorted tuple of (name, value) pairs.
+
+    :return: The labels as they appear in the text format, e.g.
+             ``{endpoint="api.companies_get"}``.
+    """
+    if not labels:
+        return ''
+    escape = str.maketrans({'\\': r'\\', '"': r'\"', '\n': r'\n'})
+    return '{' + ','.join(f'{name}="{str(value).translate(escape)}"' for name, value in labels) + '}'
+
+
+metrics = Metrics()
+local = threading.local()
+
+
+def set_query(name):
+    """
+    Set the query function that is executed by the current thread, the sql
+    statements executed until the next call are timed for this function.
+
+    :param name: The name of the query function or None.
+    """
+    local.query = name
+
+
+def get_query():
+    """
+    :return: The name of the query function that is executed by the current
+             thread, 'other' when not executing a query function.
+    """
+    return getattr(local, 'query', None) or 'other'
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_started_at'] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started_at = conn.info.pop('query_started_at', None)
+    if started_at is not None:
+        seconds = time.perf_counter() - started_at
+        query = get_query()
+        metrics.observe('employee_insights_query_duration_seconds', dict(query=query), seconds)
+        slow_query_log.observe(cursor, statement, parameters, seconds, query, executemany)
+
+
+def start_request():
+    """
+    Start timing a request, registered as a before request function.
+    """
+    g.request_started_at = time.perf_counter()
+
+
+def set_status(response):
+    """
+    Keep the status of the response, registered as an after request
+    function. The request is only complete once a streamed response is
+    fully sent, which is when ``finish_request`` is called.
+
+    :param response: The response to the request.
+
+    :return: The response.
+    """
+    g.response_status = response.status_code
+    return response
+
+
+def finish_request(exception=None):
+    """
+    Count and time a request, registered as a teardown request function.
+
+    :param exception: Exception that caused the teardown, if any.
+    """
+    set_query(None)
+    started_at = g.pop('request_started_at', None)
+    if started_at is None:
+        return
+    endpoint = request.endpoint or 'none'
+    status = 500 if exception is not None else g.pop('response_status', 500)
+    metrics.increment('employee_insights_requests_total',
+                      dict(endpoint=endpoint, method=request.method, status=status))
+    metrics.observe('employee_insights_request_duration_seconds',
+                    dict(endpoint=endpoint), time.perf_counter() - started_at)
+
+
+def get_pool_gauges():
+    """
+    Measure the connection pools of the engines in ``database.engines``,
+    in-memory databases share a single connection and are not included.
+
+    :return: dict of gauge name to a list of tuples of (labels, value).
+    """
+    gauges = collections.defaultdict(list)
+    for url, engine in list(database.engines.items()):
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        labels = dict(database=engine.url.database)
+        gauges['employee_insights_pool_size'].append((labels, pool.size()))
+        gauges['employee_insights_pool_max_overflow'].append((labels, pool._max_overflow))
+        gauges['employee_insights_pool_checked_out'].append((labels, pool.checkedout()))
+        # a negative overflow means the number of connections is unlimited
+        capacity = pool.size() + pool._max_overflow
+        if pool._max_overflow >= 0 and capacity > 0:
+            gauges['employee_insights_pool_saturation'].append(
+                (labels, pool.checkedout() / capacity))
+    return gauges
+
+
+def init_app(app):
+    """
+    Collect the metrics of an application: the requests to the application
+    and the sql statements executed by all engines.
+
+    :param app: The Flask application.
+    """
+    app.before_request(start_request)
+    app.after_request(set_status)
+    app.teardown_request(finish_request)
+    if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
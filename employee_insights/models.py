@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Table, func
+import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table, Index, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy_repr import RepresentableBase
@@ -30,18 +31,20 @@ class Location(Base):
     city = Column(String, index=True)
     employees = relationship('Employee', back_populates='location')
 
-    @hybrid_property
-    def country_description(self):
-        return self.continent + "/" + self.country
 
-    @hybrid_property
-    def state_description(self):
-        return self.continent + "/" + self.country + "/" + self.state
+class LocationPath(Base):
 
-    @hybrid_property
-    def city_description(self):
-        return func.rtrim(self.continent + "/" + self.country + "/" +
-                          self.state + "/" + self.city, '/')
+    __tablename__ = 'location_path'
+
+    location_id = Column(Integer, ForeignKey('location.location_id'), primary_key=True)
+    # the number of location fields in the path, from 1 (continent) to 4
+    # (city), every location has a path for each depth.
+    depth = Column(Integer, primary_key=True)
+    # the location fields up to depth joined by '/'
+    path = Column(String, index=True)
+    # the path as shown in the list of locations, at the city level trailing
+    # separators of empty fields are removed.
+    name = Column(String, index=True)
 
 
 class JobTitle(Base):
@@ -57,15 +60,53 @@ class JobTitle(Base):
 NOW = "now"
 
 
+# dates are stored as day numbers (``datetime.date.toordinal``), this is the
+# difference between a day number and the SQLite julian day.
+JULIAN_DAY_OFFSET = 1721424.5
+
+
+def get_age(day, as_of=None):
+    """
+    Get the SQL expression for the age in years of a date of birth.
+
+    :param day: Day number (or expression giving a day number) of the date
+                of birth.
+    :param as_of: The date to calculate the age at, when not given the age
+                  is calculated at ``NOW``.
+
+    :return: SQL expression giving the age in years.
+    """
+    return (get_as_of_day(as_of) - day) / 365.25
+
+
+def get_as_of_day(as_of=None):
+    """
+    Get the day number (or SQL expression giving the day number) to
+    calculate ages at.
+
+    :param as_of: The date to calculate the age at, when not given the
+                  (fractional) day number of ``NOW`` is used.
+
+    :return: Day number or SQL expression giving the day number.
+    """
+    if as_of is None:
+        return func.julianday(NOW) - JULIAN_DAY_OFFSET
+    return as_of.toordinal()
+
+
 class Employee(Base):
 
     __tablename__ = 'employee'
-    __table_args__ = {'sqlite_autoincrement': True}
+    __table_args__ = (
+        Index('ix_employee_company_id_date_of_birth_day', 'company_id', 'date_of_birth_day'),
+        {'sqlite_autoincrement': True},
+    )
 
     employee_id = Column(Integer, primary_key=True, autoincrement=True)
+    record_id = Column(String, index=True, unique=True)
     first_name = Column(String)
     last_name = Column(String)
-    date_of_birth = Column(Date)
+    date_of_birth_day = Column(Integer)
 
     company_id = Column(Integer, ForeignKey('company.company_id'))
     company = relationship('Company', back_populates='employees')
@@ -76,6 +117,97 @@ class Employee(Base):
     location_id = Column(Integer, ForeignKey('location.location_id'))
     location = relationship('Location', back_populates='employees')
 
+    @hybrid_property
+    def date_of_birth(self):
+        return datetime.date.fromordinal(self.date_of_birth_day)
+
+    @date_of_birth.setter
+    def date_of_birth(self, value):
+        self.date_of_birth_day = value.toordinal()
+
+    @date_of_birth.expression
+    def date_of_birth(cls):
+        return func.date(cls.date_of_birth_day + JULIAN_DAY_OFFSET)
+
     @hybrid_property
     def age(self):
-        return (func.julianday(NOW) - func.julianday(self.date_of_birth)) / 365.25
+        return get_age(self.date_of_birth_day)
+
+
+# the tables below contain statistics per company which are maintained on
+# import, see ``employee_insights.statistics``
+
+
+class CompanyStatistics(Base):
+
+    __tablename__ = 'company_statistics'
+
+    company_id = Column(Integer, ForeignKey('company.company_id'), primary_key=True)
+    employee_count = Column(Integer)
+    # position of the oldest employee of the company in ``CompanyAgeIndex``
+    first_position = Column(Integer)
+    # sum of the day numbers of the dates of birth, unlike the sum of the
+    # ages this does not change over time.
+    date_of_birth_sum = Column(Integer)
+
+    @hybrid_property
+    def average_date_of_birth_day(self):
+        return 1.0 * self.date_of_birth_sum / self.employee_count
+
+    @hybrid_property
+    def average_employee_age(self):
+        return get_age(self.average_date_of_birth_day)
+
+
+class CompanyAgeIndex(Base):
+
+    __tablename__ = 'company_age_index'
+    __table_args__ = (
+        Index('ix_company_age_index_company_id_date_of_birth_day',
+              'company_id', 'date_of_birth_day', 'position'),
+    )
+
+    # the employees numbered in order of company and date of birth, so the
+    # number of employees of a company born before a day is the difference
+    # between two positions, and the n-th oldest employee of a company is at
+    # ``CompanyStatistics.first_position + n``.
+    position = Column(Integer, primary_key=True)
+    company_id = Column(Integer, ForeignKey('company.company_id'))
+    date_of_birth_day = Column(Integer)
+
+
+class CompanyJobTitleStatistics(Base):
+
+    __tablename__ = 'company_job_title_statistics'
+
+    company_id = Column(Integer, ForeignKey('company.company_id'), primary_key=True)
+    job_title_id = Column(Integer, ForeignKey('job_title.job_title_id'), primary_key=True)
+    employee_count = Column(Integer)
+
+
+class CompanyLocationStatistics(Base):
+
+    __tablename__ = 'company_location_statistics'
+    __table_args__ = (
+        Index('ix_company_location_statistics_path_depth', 'path', 'depth'),
+    )
+
+    company_id = Column(Integer, ForeignKey('company.company_id'), primary_key=True)
+    # depth and path of a location path, see ``LocationPath``
+    depth = Column(Integer, primary_key=True)
+    path = Column(String, primary_key=True)
+    employee_count = Column(Integer)
+
+
+class Dataset(Base):
+
+    __tablename__ = 'dataset'
+
+    dataset_id = Column(Integer, primary_key=True)
+    # incremented by every import, so results can be cached per generation
+    generation = Column(Integer)
+    imported_at = Column(DateTime)
+    # the timestamp the ages in the csv file of the last full import pertain
+    # to, incremental imports calculate the dates of birth with the same
+    # timestamp so unchanged ages give unchanged dates of birth.
+    timestamp = Column(DateTime)
@@ -1,7 +1,11 @@
 from employee_insights.queries.company_statistics import *
 from employee_insights.queries.employees_per_company import *
 from employee_insights.queries.percentage_by_location import *
+from employee_insights.queries.percentage_by_location_rollup import *
 from employee_insights.queries.percentage_older_than_average import *
+from employee_insights.queries.percentage_older_than_average_curve import *
 from employee_insights.queries.percentage_per_job_title import *
 from employee_insights.queries.employees import *
-from employee_insights.queries.locations import *
\ No newline at end of file
+from employee_insights.queries.locations import *
+from employee_insights.queries.age_quantiles import *
+from employee_insights.queries.age_distribution import *
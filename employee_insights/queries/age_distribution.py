@@ -0,0 +1,57 @@
+# std
+import collections
+# local
+from employee_insights.models import Company, CompanyStatistics, get_as_of_day
+from employee_insights.queries.percentage_older_than_average import get_born_before_count
+
+
+AgeDistribution = collections.namedtuple('AgeDistribution', [
+    'company_id',
+    'company_name',
+    'min_age',
+    'max_age',
+    'percentage',
+])
+
+
+def get_age_distribution(session, ages, as_of=None):
+    """
+    Get the percentage of the employees per company in age groups.
+
+    The number of employees older than each of the ``ages`` is found with a
+    seek of the age index (see ``get_born_before_count``), so the
+    distribution does not depend on the number of employees of a company.
+
+    :param session: SQLAlchemy session to use for generating the query.
+    :param ages: Ascending sequence of ages which are the boundaries of the
+                 age groups, an employee is in the group from ``min_age`` to
+                 ``max_age`` when older than ``min_age`` and not older than
+                 ``max_age``.
+    :param as_of: The date to calculate the ages at, see ``get_age``.
+
+    :return: list of ``AgeDistribution`` for every company and each pair of
+             consecutive ``ages``, ordered by company id.
+    """
+    as_of_day = get_as_of_day(as_of)
+    employees_older = [
+        get_born_before_count(session, CompanyStatistics, as_of_day - float(age) * 365.25)
+        for age in ages
+    ]
+    companies = (session
+.       query       (
+                     CompanyStatistics.company_id,
+                     Company.company_name,
+                     CompanyStatistics.employee_count,
+                     *employees_older
+                    )
+.       select_from (CompanyStatistics)
+.       join        (Company)
+.       order_by    (CompanyStatistics.company_id)
+    )
+
+    result = []
+    for company_id, company_name, employee_count, *n_older in companies:
+        for i in range(len(ages) - 1):
+            percentage = 100.0 * (n_older[i] - n_older[i + 1]) / employee_count
+            result.append(AgeDistribution(company_id, company_name, ages[i], ages[i + 1], percentage))
+    return result
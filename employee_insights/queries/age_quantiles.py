@@ -0,0 +1,69 @@
+# std
+import collections
+# 3rd party
+from sqlalchemy import func, cast, select, literal, union_all, true, Integer
+from sqlalchemy.orm import aliased
+# local
+from employee_insights.models import Company, CompanyStatistics, CompanyAgeIndex, get_age
+
+
+AgeQuantile = collections.namedtuple('AgeQuantile', [
+    'company_id',
+    'company_name',
+    'quantile',
+    'age',
+])
+
+
+def get_age_quantiles(session, quantiles, as_of=None):
+    """
+    Get quantiles of the employee age per company.
+
+    The quantiles are interpolated linearly between the two closest ages.
+    The employees with these ages are found by their position in the age
+    index, so the quantiles do not depend on the number of employees of a
+    company. All quantiles are selected in a single statement, joining the
+    company statistics to the given quantiles and to the age index at the
+    two positions of each quantile.
+
+    :param session: SQLAlchemy session to use for generating the query.
+    :param quantiles: Sequence of quantiles between 0 and 1, 0.5 is the
+                      median age.
+    :param as_of: The date to calculate the ages at, see ``get_age``.
+
+    :return: list of ``AgeQuantile`` for every company and each of
+             ``quantiles``, ordered by company id.
+    """
+    quantiles = list(quantiles)
+    if not quantiles:
+        return []
+
+    selects = [select([literal(i).label('quantile_index'), literal(float(x)).label('quantile')])
+               for i, x in enumerate(quantiles)]
+    quantile = (selects[0] if len(selects) == 1 else union_all(*selects)).alias('quantile')
+
+    # the employees are ordered oldest first, so by descending age
+    last = CompanyStatistics.employee_count - 1
+    index = last * (1.0 - quantile.c.quantile)
+    lower = cast(index, Integer)
+    lower_index = aliased(CompanyAgeIndex)
+    upper_index = aliased(CompanyAgeIndex)
+    day = (lower_index.date_of_birth_day +
+           (upper_index.date_of_birth_day - lower_index.date_of_birth_day) * (index - lower))
+
+    ages = (session
+.       query       (
+                     CompanyStatistics.company_id,
+                     Company.company_name,
+                     quantile.c.quantile_index,
+                     get_age(day, as_of).label('age'),
+                    )
+.       select_from (CompanyStatistics)
+.       join        (Company)
+.       join        (quantile, true())
+.       join        (lower_index, lower_index.position == CompanyStatistics.first_position + lower)
+.       join        (upper_index, upper_index.position ==
+                     CompanyStatistics.first_position + func.min(lower + 1, last))
+.       order_by    (CompanyStatistics.company_id, quantile.c.quantile_index)
+    )
+    return [AgeQuantile(x.company_id, x.company_name, quantiles[x.quantile_index], x.age) for x in ages]
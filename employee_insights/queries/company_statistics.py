@@ -1,14 +1,13 @@
-# 3rd party
-from sqlalchemy import func
 # local
-from employee_insights.models import Employee
+from employee_insights.models import CompanyStatistics, get_age
 
 
-def get_company_statistics(session):
+def get_company_statistics(session, as_of=None):
     """
     Retrieve a query for retrieving company aggregated statistics.
 
     :param session: SQLAlchemy session to use for generating the query.
+    :param as_of: The date to calculate the ages at, see ``get_age``.
 
     :return: Query object giving the percentage of all employees for a company
              that are years older than the company-wide average. The following
@@ -17,8 +16,8 @@ def get_company_statistics(session):
                 - company_name
                 - average_employee_age
     """
-    average_employee_age = func.avg(Employee.age).label('average_employee_age')
+    average_employee_age = get_age(CompanyStatistics.average_date_of_birth_day, as_of)
+    average_employee_age = average_employee_age.label('average_employee_age')
     return (session
-.       query       (Employee.company_id, average_employee_age)
-.       group_by    (Employee.company_id)
+.       query       (CompanyStatistics.company_id, average_employee_age)
     )
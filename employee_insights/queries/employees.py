@@ -1,12 +1,18 @@
 # local
-from employee_insights.models import Employee, JobTitle, Location, Company
+from employee_insights.models import Employee, JobTitle, Location, Company, get_age
 
 
-def get_employees(session):
+def get_employees(session, after=None, limit=None, as_of=None):
     """
     Get the query for retrieving all employees.
 
     :param session: SQLAlchemy session to use for generating the query.
+    :param after: When given only employees with an id greater than this
+                  are retrieved, ordered by id. Together with ``limit``
+                  this allows paging through the employees by seeking on
+                  the primary key, rather than using an offset.
+    :param limit: The maximum number of employees to retrieve.
+    :param as_of: The date to calculate the ages at, see ``get_age``.
 
     :return: Query object giving the number of all employees for a company.
              The following columns are available:
@@ -18,11 +24,12 @@ def get_employees(session):
                 - state
                 - city
                 - age
+                - date_of_birth_day
                 - first_name
                 - last_name
                 - company_name
     """
-    return ( session
+    query = ( session
 .       query       (
                      Employee.employee_id,
                      JobTitle.job_title,
@@ -30,7 +37,8 @@ def get_employees(session):
                      Location.country,
                      Location.state,
                      Location.city,
-                     Employee.age,
+                     get_age(Employee.date_of_birth_day, as_of).label('age'),
+                     Employee.date_of_birth_day,
                      Employee.first_name,
                      Employee.last_name,
                      Company.company_name,
@@ -39,3 +47,12 @@ def get_employees(session):
 .       join        (Location)
 .       join        (Company)
     )
+
+    if after is not None or limit is not None:
+        query = ( query
+.           filter      (Employee.employee_id > (after or 0))
+.           order_by    (Employee.employee_id)
+.           limit       (limit)
+        )
+
+    return query
@@ -1,7 +1,5 @@
-# 3rd party
-from sqlalchemy import func
 # local
-from employee_insights.models import Company, Employee
+from employee_insights.models import CompanyStatistics
 
 
 def get_employees_per_company(session):
@@ -17,7 +15,8 @@ def get_employees_per_company(session):
                 - employee_count
     """
     return ( session
-.       query       (Company.company_id, func.count().label('total'))
-.       join        (Employee)
-.       group_by    (Company.company_id)
+.       query       (
+                     CompanyStatistics.company_id,
+                     CompanyStatistics.employee_count.label('total'),
+                    )
     )
\ No newline at end of file
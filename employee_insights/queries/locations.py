@@ -1,5 +1,5 @@
 # local
-from employee_insights.models import Location
+from employee_insights.models import LocationPath
 
 
 def get_locations(session):
@@ -14,8 +14,7 @@ def get_locations(session):
                 - location
     """
     return ( session
-.       query   (Location.continent.label('location'))
-.       union   (session.query(Location.country_description))
-.       union   (session.query(Location.state_description))
-.       union   (session.query(Location.city_description))
+.       query       (LocationPath.name.label('location'))
+.       distinct    ()
+.       order_by    (LocationPath.name)
     )
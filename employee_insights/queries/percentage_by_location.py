@@ -1,9 +1,5 @@
-# std
-from itertools import zip_longest
-# 3rd party
-from sqlalchemy import func, and_
 # local
-from employee_insights.models import Employee, Location, Company
+from employee_insights.models import Company, CompanyLocationStatistics
 from employee_insights.queries.employees_per_company import  get_employees_per_company
 
 
@@ -33,38 +29,22 @@ def get_employees_percentage_by_location(session, location, min_percentage):
     """
     employees_per_company = get_employees_per_company(session).subquery()
 
-    location = (x for x, _ in zip_longest(location.split('/'), range(4)))
-    continent, country, state, city = location
+    Statistics = CompanyLocationStatistics
+    depth = len(location.split('/'))
 
-    if city is not None:
-        group_by = Location.continent + '/' + Location.country + '/' + Location.state + '/' + Location.city
-        where = and_(Location.continent == continent, Location.country == country,
-                     Location.state == state, Location.city == city)
-    elif state is not None:
-        group_by = Location.continent + '/' + Location.country + '/' + Location.state
-        where = and_(Location.continent == continent, Location.country == country,
-                     Location.state == state)
-    elif country is not None:
-        group_by = Location.continent + '/' + Location.country
-        where = and_(Location.continent == continent, Location.country == country)
-    else:
-        group_by = Location.continent
-        where = Location.continent == continent
-
-    percentage = ((1.0 * func.count()) / employees_per_company.c.total * 100)
+    percentage = ((1.0 * Statistics.employee_count) / employees_per_company.c.total * 100)
 
     return (session
 .       query       (
                      Company.company_id,
                      Company.company_name,
-                     group_by.label('location'),
+                     Statistics.path.label('location'),
                      percentage.label('percentage'),
                     )
-.       join        (Employee)
-.       join        (Location)
+.       select_from (Statistics)
+.       join        (Company)
 .       join        (employees_per_company,
                      employees_per_company.c.company_id == Company.company_id)
-.       filter      (where)
-.       group_by    (Employee.company_id, group_by)
-.       having      (percentage > float(min_percentage))
+.       filter      (Statistics.path == location, Statistics.depth == depth)
+.       filter      (percentage > float(min_percentage))
     )
@@ -0,0 +1,53 @@
+# local
+from employee_insights.models import Company, CompanyStatistics, CompanyLocationStatistics
+
+
+def get_employees_percentage_by_location_rollup(session, min_percentage, depth=None):
+    """
+    Get the query for retrieving the percentage of employees of a company at
+    every location, at every level of the location hierarchy, filtered by a
+    minimum percentage of employees.
+
+    The employee counts per company and location path are maintained on
+    import (see ``CompanyLocationStatistics``), so this is a single scan of
+    these counts rather than a query per location.
+
+    :param session: SQLAlchemy session to use for generating the query.
+    :param min_percentage: The minimum percentage to filter the results by.
+    :param depth: When given only the locations at this level are retrieved,
+                  from 1 (continent) to 4 (city).
+
+    :return: Query object giving the percentage of employees of a company at
+             each location, ordered by company, depth and location.
+             The following columns are available:
+
+                - company_id
+                - company_name
+                - depth
+                - location
+                - percentage
+    """
+    Statistics = CompanyLocationStatistics
+    percentage = ((1.0 * Statistics.employee_count) / CompanyStatistics.employee_count * 100)
+
+    query = (session
+.       query       (
+                     Company.company_id,
+                     Company.company_name,
+                     Statistics.depth,
+                     Statistics.path.label('location'),
+                     percentage.label('percentage'),
+                    )
+.       select_from (Statistics)
+.       join        (CompanyStatistics,
+                     CompanyStatistics.company_id == Statistics.company_id)
+.       join        (Company,
+                     Company.company_id == Statistics.company_id)
+.       filter      (percentage > float(min_percentage))
+.       order_by    (Statistics.company_id, Statistics.depth, Statistics.path)
+    )
+
+    if depth is not None:
+        query = query.filter(Statistics.depth == depth)
+
+    return query
@@ -1,26 +1,58 @@
 # 3rd party
-from sqlalchemy import func, case
+from sqlalchemy import func
 # local
-from employee_insights.models import Employee, Company
-from employee_insights.queries.company_statistics import get_company_statistics
+from employee_insights.models import Company, CompanyStatistics, CompanyAgeIndex, get_age
 
 
-def get_is_older_case(company_statistics, years):
+def get_older_than_average_day(company_statistics, years):
     """
-    Get the case clause or determining if an employee is ``years`` older
-    than the company-wide average.
+    Get the day before which the employees that are ``years`` older than the
+    company-wide average are born.
 
-    :param company_statistics: Sub-query containing company_statistics
+    An employee is older than the average age plus ``years`` when the date of
+    birth is more than ``years`` before the average date of birth, this does
+    not depend on the current date.
+
+    :param company_statistics: CompanyStatistics of the company.
     :param years: This many years older than the company-wide average.
 
-    :return: Case clause which gives 1.0 for an employee that is years older
-             than the company-wide average, otherwise 0.0
+    :return: SQL expression giving the (fractional) day number.
+    """
+    average_day = company_statistics.average_date_of_birth_day
+    return average_day - float(years) * 365.25
+
+
+def get_born_before_count(session, company_statistics, day):
+    """
+    Get the number of employees of a company born before a day.
+
+    This is the position of the first employee born on or after the day in
+    the age index minus the position of the first employee of the company,
+    found with a single seek of the index on company and date of birth. So
+    it does not depend on the number of employees of the company.
+
+    :param session: SQLAlchemy session to use for generating the query.
+    :param company_statistics: CompanyStatistics of the company.
+    :param day: (Possibly fractional) day number, or SQL expression giving
+                the day number.
+
+    :return: SQL expression giving the number of employees born before day.
     """
-    when = (Employee.age - years) > company_statistics.c.average_employee_age
-    return case([(when, 1.0)], else_=0.0)
+    position = (session
+.       query       (CompanyAgeIndex.position)
+.       filter      (CompanyAgeIndex.company_id == company_statistics.company_id)
+.       filter      (CompanyAgeIndex.date_of_birth_day >= day)
+.       order_by    (CompanyAgeIndex.date_of_birth_day, CompanyAgeIndex.position)
+.       limit       (1)
+.       correlate   (company_statistics)
+.       as_scalar   ()
+    )
+    # all employees are born before the day when there is no such employee
+    end_position = company_statistics.first_position + company_statistics.employee_count
+    return func.coalesce(position, end_position) - company_statistics.first_position
 
 
-def get_employees_percentage_older_than_average(session, years):
+def get_employees_percentage_older_than_average(session, years, as_of=None):
     """
     Get the query for retrieving the percentage of all employees per company
     that are specified number of years older than the company-wide average.
@@ -28,6 +60,7 @@ def get_employees_percentage_older_than_average(session, years):
     :param session: SQLAlchemy session to use for generating the query.
     :param years: Query the percentage of employees that are this many years
                     older than the company-wide average.
+    :param as_of: The date to calculate the average age at, see ``get_age``.
 
     :return: Query object giving the percentage of all employees for a company
              that are years older than the company-wide average. The following
@@ -39,18 +72,18 @@ def get_employees_percentage_older_than_average(session, years):
                 - percentage_older
 
     """
-    company_statistics = get_company_statistics(session).subquery()
-    is_older = get_is_older_case(company_statistics, years)
-    percentage_older = (func.sum(is_older) / func.count() * 100)
+    threshold = get_older_than_average_day(CompanyStatistics, years)
+    employees_older = get_born_before_count(session, CompanyStatistics, threshold)
+    percentage_older = 100.0 * employees_older / CompanyStatistics.employee_count
+    average_employee_age = get_age(CompanyStatistics.average_date_of_birth_day, as_of)
 
     return (session
 .       query       (
                      Company.company_id,
                      Company.company_name,
-                     company_statistics.c.average_employee_age,
+                     average_employee_age.label('average_employee_age'),
                      percentage_older.label('percentage_older'),
                     )
-.       join        (Employee.company)
-.       join        (company_statistics)
-.       group_by    (Employee.company_id)
+.       select_from (CompanyStatistics)
+.       join        (Company)
     )
@@ -0,0 +1,70 @@
+# std
+import bisect
+import collections
+# local
+from employee_insights.models import Company, CompanyStatistics, CompanyAgeIndex, get_age
+from employee_insights.queries.percentage_older_than_average import get_older_than_average_day
+
+
+PercentageOlderThanAverageCurve = collections.namedtuple('PercentageOlderThanAverageCurve', [
+    'company_id',
+    'company_name',
+    'average_employee_age',
+    'years',
+    'percentage_older',
+])
+
+
+def get_employees_percentage_older_than_average_curve(session, years, as_of=None):
+    """
+    Get the percentage of all employees per company that are older than the
+    company-wide average for several numbers of years at once.
+
+    The company statistics and the dates of birth in the age index are read
+    once, in order of company and date of birth (a scan of the index on
+    these), the number of employees older than each threshold is then a
+    binary search. So the number of statements does not depend on the number
+    of ``years``. The percentages are the same as those of
+    ``get_employees_percentage_older_than_average`` for each of the
+    ``years``.
+
+    :param session: SQLAlchemy session to use for generating the query.
+    :param years: Sequence of numbers of years older than the company-wide
+                  average.
+    :param as_of: The date to calculate the average age at, see ``get_age``.
+
+    :return: list of ``PercentageOlderThanAverageCurve`` for every company
+             and each of ``years``, ordered by company id.
+    """
+    average_employee_age = get_age(CompanyStatistics.average_date_of_birth_day, as_of)
+    companies = (session
+.       query       (
+                     CompanyStatistics.company_id,
+                     Company.company_name,
+                     CompanyStatistics.employee_count,
+                     CompanyStatistics.average_date_of_birth_day,
+                     average_employee_age.label('average_employee_age'),
+                    )
+.       select_from (CompanyStatistics)
+.       join        (Company)
+.       order_by    (CompanyStatistics.company_id)
+    )
+    dates_of_birth = (session
+.       query       (CompanyAgeIndex.company_id, CompanyAgeIndex.date_of_birth_day)
+.       order_by    (CompanyAgeIndex.company_id, CompanyAgeIndex.date_of_birth_day)
+    )
+
+    days = collections.defaultdict(list)
+    for company_id, date_of_birth_day in dates_of_birth:
+        days[company_id].append(date_of_birth_day)
+
+    result = []
+    for company in companies:
+        company_days = days[company.company_id]
+        for n_years in years:
+            threshold = get_older_than_average_day(company, n_years)
+            percentage_older = 100.0 * bisect.bisect_left(company_days, threshold) / company.employee_count
+            result.append(PercentageOlderThanAverageCurve(
+                company.company_id, company.company_name,
+                company.average_employee_age, n_years, percentage_older))
+    return result
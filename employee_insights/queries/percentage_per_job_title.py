@@ -1,7 +1,5 @@
-# 3rd party
-from sqlalchemy import func
 # local
-from employee_insights.models import Employee, Company, JobTitle
+from employee_insights.models import Company, JobTitle, CompanyJobTitleStatistics
 from employee_insights.queries.employees_per_company import  get_employees_per_company
 
 
@@ -22,17 +20,18 @@ def get_employees_percentage_per_job_title(session):
     """
     employees_per_company = get_employees_per_company(session).subquery()
     to_float = lambda x: 1.0 * x
+    employee_count = CompanyJobTitleStatistics.employee_count
     return (session
 .       query       (
                      Company.company_id,
                      Company.company_name,
-                     Employee.job_title_id,
+                     CompanyJobTitleStatistics.job_title_id,
                      JobTitle.job_title,
-                     (to_float(func.count()) / employees_per_company.c.total * 100).label('percentage'),
+                     (to_float(employee_count) / employees_per_company.c.total * 100).label('percentage'),
                     )
-.       join        (Employee)
+.       select_from (CompanyJobTitleStatistics)
+.       join        (Company)
 .       join        (JobTitle)
 .       join        (employees_per_company,
                      employees_per_company.c.company_id == Company.company_id)
-.       group_by    (Company.company_id, Employee.job_title_id)
     )
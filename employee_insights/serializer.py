@@ -1,14 +1,43 @@
 # std
+import io
+import os
 import csv
 import collections
 import datetime
-import frozendict
 import contextlib
+import itertools
+import time
+import uuid
+import operator
+import functools
+import tracemalloc
+import multiprocessing
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 # 3rd party
-import attr
+from sqlalchemy import select, func, bindparam, MetaData, Table, Column, String
 # local
+from employee_insights import database
+from employee_insights.instrumentation import LoadReport
 from employee_insights.models import *
+from employee_insights.statistics import update_statistics, update_changed_statistics
+from employee_insights.queries.employees import get_employees
+
+
+def batches(iterable, size):
+    """
+    Split an iterable into lists of at most ``size`` items.
+
+    :param iterable: The iterable to split.
+    :param size: The maximum number of items per batch.
+
+    :return: Generator which when iterated yields lists of items.
+    """
+    iterator = iter(iterable)
+    batch = list(itertools.islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(iterator, size))
 
 
 def age_to_date_of_birth(age, timestamp):
@@ -23,22 +52,79 @@ def date_of_birth_to_age(date_of_birth, timestamp):
     return delta.days / 365.25
 
 
-@attr.s
+# the approximate size in bytes of the parts of a csv file that are parsed by
+# a worker process when parsing in parallel.
+PARSE_RANGE_SIZE = 2 ** 22
+
+
+# the phases of an import as reported by ``CsvSerializer``: reading the csv
+# records, deleting the previous dataset, inserting the dimensions (job
+# titles, companies and locations), inserting the employees and updating the
+# statistics and committing.
+PHASES = ('parse', 'delete', 'dimension', 'insert', 'commit')
+
+
+# the record ids of the csv file during an incremental load, see
+# ``CsvSerializer._load_incremental``.
+record_ids = Table('incremental_record_id', MetaData(),
+                   Column('record_id', String, primary_key=True),
+                   prefixes=['TEMPORARY'])
+
+
 class CsvRecord(object):
     """
     Represents a record containing employee information from the csv file.
+
+    There is one instance per row of the csv file, so the fields are slots
+    rather than an instance dict to keep these small and cheap to create.
     """
-    record_id = attr.ib()
-    job_title = attr.ib()
-    continent = attr.ib()
-    country = attr.ib()
-    state = attr.ib()
-    city = attr.ib()
-    age = attr.ib()
-    first_name = attr.ib()
-    last_name = attr.ib()
-    company_name = attr.ib()
-    timestamp = attr.ib()
+    __slots__ = (
+        'record_id',
+        'job_title',
+        'continent',
+        'country',
+        'state',
+        'city',
+        'age',
+        'first_name',
+        'last_name',
+        'company_name',
+        'timestamp',
+        # day number of the date of birth when calculated in advance, see
+        # ``parse_range``
+        'date_of_birth_day',
+    )
+
+    def __init__(self, record_id, job_title, continent, country, state, city, age,
+                 first_name, last_name, company_name, timestamp, date_of_birth_day=None):
+        self.record_id = record_id
+        self.job_title = job_title
+        self.continent = continent
+        self.country = country
+        self.state = state
+        self.city = city
+        self.age = age
+        self.first_name = first_name
+        self.last_name = last_name
+        self.company_name = company_name
+        self.timestamp = timestamp
+        self.date_of_birth_day = date_of_birth_day
+
+    def __repr__(self):
+        fields = ', '.join('{}={!r}'.format(x, getattr(self, x)) for x in self.__slots__)
+        return '{}({})'.format(type(self).__name__, fields)
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.astuple() == other.astuple()
+
+    def astuple(self):
+        """
+        :return: tuple with the values of the fields, in the order of the
+                 arguments of ``CsvRecord``.
+        """
+        return tuple(getattr(self, x) for x in self.__slots__)
 
     @property
     def date_of_birth(self):
@@ -49,44 +135,623 @@ class CsvRecord(object):
         return age_to_date_of_birth(self.age, self.timestamp)
 
 
+class DimensionEncoder(object):
+    """
+    Gets the key and the column values of a model class from csv records,
+    with the columns which are taken from the csv record determined once per
+    model class instead of for every record.
+    """
+
+    def __init__(self, model_cls):
+        """
+        :param model_cls: The model class to encode csv records for.
+        """
+        table = model_cls.__table__
+        primary_key, = table.primary_key.columns
+        self.primary_key = primary_key.name
+        self.columns = tuple(x.name for x in table.columns if x.name in CsvRecord.__slots__)
+        getter = operator.attrgetter(*self.columns)
+        self.get_key = getter if len(self.columns) > 1 else lambda x: (getter(x),)
+
+    def get_fields(self, csv_record, extra_fields=None):
+        """
+        Get the fields from the csv record and the additional fields that are
+        also columns of the model class.
+
+        :param csv_record: Record containing employee data from the input csv
+        :param extra_fields: dict of extra fields which should be included,
+                             these take precedence over the csv record.
+
+        :return: dict containing the values for the columns of the model
+                 class.
+        """
+        fields = dict(zip(self.columns, self.get_key(csv_record)))
+        if extra_fields:
+            fields.update(extra_fields)
+        return fields
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(model_cls):
+    """
+    :param model_cls: The model class to get the encoder for.
+
+    :return: The ``DimensionEncoder`` of ``model_cls``.
+    """
+    return DimensionEncoder(model_cls)
+
+
+def parse_range(path, start, end, timestamp):
+    """
+    Parse the csv records in a byte range of a csv file, and calculate the
+    dates of birth. This runs in a worker process, see ``parse_parallel``.
+
+    :param path: Path of the csv file.
+    :param start: Offset of the first byte of the range, which is the start
+                  of a line.
+    :param end: Offset after the last byte of the range, which is the end of
+                a line.
+    :param timestamp: The timestamp to which the csv data pertains.
+
+    :return: list of tuples with the values of the fields of ``CsvRecord``,
+             tuples are much cheaper to send back to the parent process
+             than instances.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start).decode('utf-8')
+
+    return [
+        (*record, timestamp, age_to_date_of_birth(record[6], timestamp).toordinal())
+        for record in csv.reader(io.StringIO(data, newline=''), delimiter=',')
+    ]
+
+
+def split_lines(path, size):
+    """
+    Split a csv file, without the headers, into byte ranges on line
+    boundaries. This assumes the csv dialect of the data set, where fields
+    do not contain line breaks.
+
+    :param path: Path of the csv file.
+    :param size: The approximate size of a range in bytes.
+
+    :return: list of tuples of (start, end) offsets.
+    """
+    ranges = []
+    with open(path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        f.readline()  # skip headers
+        start = f.tell()
+        while start < file_size:
+            f.seek(min(start + size, file_size))
+            f.readline()
+            end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_parallel(path, timestamp, workers, range_size=PARSE_RANGE_SIZE):
+    """
+    Parse a csv file in byte ranges on a pool of worker processes.
+
+    The ranges are parsed concurrently, but the records are yielded in file
+    order, so ids are assigned to the dimensions exactly as when parsing
+    serially. At most two ranges per worker are parsed ahead of the
+    records that are being loaded.
+
+    :param path: Path of the csv file.
+    :param timestamp: The timestamp to which the csv data pertains.
+    :param workers: The number of worker processes.
+    :param range_size: The approximate size of a range in bytes.
+
+    :return: Generator which when iterated yields ``CsvRecord``.
+    """
+    ranges = iter(split_lines(path, range_size))
+    # spawn rather than fork, the server process can have other threads
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        futures = collections.deque(
+            executor.submit(parse_range, path, start, end, timestamp)
+            for start, end in itertools.islice(ranges, 2 * workers)
+        )
+        while futures:
+            records = futures.popleft().result()
+            for start, end in itertools.islice(ranges, 1):
+                futures.append(executor.submit(parse_range, path, start, end, timestamp))
+            for record in records:
+                yield CsvRecord(*record)
+
+
 class CsvSerializer(object):
     """
     Serialize / Deserialize the employee insights database to and from csv.
     """
 
-    def __init__(self, session):
+    def __init__(self, session, bulk=False, batch_size=10000,
+                 chunk_size=None, progress=None, phase=None, staging=False, incremental=False,
+                 workers=None, trace_memory=False):
+        """
+        :param session: SQLAlchemy session to load into / dump from.
+        :param bulk: When True ``load`` writes plain rows with Core
+                     ``executemany`` batches instead of ORM instances, which
+                     skips the unit of work and identity tracking.
+        :param batch_size: The number of rows per ``executemany`` batch when
+                           loading in bulk.
+        :param chunk_size: When given ``load`` streams the csv file, only the
+                           dimensions are kept in memory and the employees
+                           are inserted and committed in chunks of this many
+                           rows. This implies ``bulk``.
+        :param progress: Callable which is called with the number of rows
+                         loaded so far, after every committed chunk.
+        :param phase: Callable which is called with the name of the phase
+                      ``load`` enters, one of ``PHASES``. When loading in
+                      chunks the phases are repeated for every chunk.
+        :param staging: When True ``load`` writes into new staging tables
+                        which replace the live tables in one transaction
+                        once the import is complete, so readers keep seeing
+                        the previous dataset until then. This implies
+                        ``bulk``.
+        :param incremental: When True ``load`` compares the csv file with the
+                            employees in the database using the record id,
+                            and only inserts, updates and deletes the
+                            employees that changed. This implies ``bulk``.
+        :param workers: When greater than one and the csv file given to
+                        ``load`` is a file on disk, the file is parsed by
+                        this many worker processes, see ``parse_parallel``.
+        :param trace_memory: When True ``load`` traces memory allocations with
+                             ``tracemalloc`` to report the peak allocated
+                             memory per phase, which makes loading slower.
+        """
         self.session = session
+        self.bulk = bulk or chunk_size is not None or staging or incremental
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.phase = phase
+        self.current_phase = None
+        self.staging = staging
+        self.staging_tables = {}
+        self.incremental = incremental
+        self.changes = collections.Counter()
         self.store = {}
+        self.workers = workers
+        self.trace_memory = trace_memory
+        self.report = LoadReport()
+        self.n_rows = 0
+        self.timestamp = None
 
-    def load(self, fileobj, timestamp=datetime.datetime.now()):
+    def load(self, fileobj, timestamp=None):
         """
         Load the employee insights database from a csv file.
 
         :param fileobj: File like object to the csv data.
         :param timestamp: The timestamp to which the csv data pertains, this is
                           for calculating the date of birth from the age.
+                          When not given this is the current time, or when
+                          loading incrementally the timestamp the dataset in
+                          the database was loaded with.
+
+        :return: dict with the time, rows per second and peak allocated memory
+                 of the phases of the load and the dimension cardinalities,
+                 see ``LoadReport.as_dict``.
         """
+        if timestamp is None and self.incremental:
+            timestamp = database.get_timestamp(self.session)
+        if timestamp is None:
+            timestamp = datetime.datetime.now()
 
         self.store = {}
+        self.current_phase = None
+        self.report = LoadReport()
+        self.n_rows = 0
+        self.timestamp = timestamp
+
+        trace_memory = self.trace_memory and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        try:
+            self._load(fileobj, timestamp)
+            self.report.finish(self.n_rows, dict(
+                companies=len(self.store.get(Company, ())),
+                locations=len(self.store.get(Location, ())),
+                job_titles=len(self.store.get(JobTitle, ())),
+            ))
+        finally:
+            if trace_memory:
+                tracemalloc.stop()
+
+        return self.report.as_dict()
+
+    def _load(self, fileobj, timestamp):
+        """
+        Load the employee insights database from a csv file, see ``load``.
 
-        reader = csv.reader(fileobj, delimiter=',')
-        next(reader)  # skip headers
-
-        for employee_id, record in enumerate(reader):
+        :param fileobj: File like object to the csv data.
+        :param timestamp: The timestamp to which the csv data pertains.
+        """
 
-            csv_record = CsvRecord(*record, timestamp=timestamp)
+        path = getattr(fileobj, 'name', None)
+        if self.workers and self.workers > 1 and isinstance(path, str) and os.path.isfile(path):
+            csv_records = parse_parallel(path, timestamp, self.workers)
+        else:
+            reader = csv.reader(fileobj, delimiter=',')
+            next(reader)  # skip headers
+            csv_records = (CsvRecord(*record, timestamp=timestamp) for record in reader)
+        csv_records = self._time_records(csv_records)
+
+        if self.incremental:
+            self._load_incremental(csv_records)
+        elif self.staging:
+            self._load_staged(csv_records)
+        elif self.chunk_size:
+            self._load_chunked(csv_records)
+        else:
+            self._load_all(csv_records)
+
+    def _load_staged(self, csv_records):
+        """
+        Load the csv records into staging tables and swap these with the live
+        tables when the import has completed.
 
-            job_title_id = self._model_factory(JobTitle, csv_record)
-            company_id = self._model_factory(Company, csv_record)
-            location_id = self._model_factory(Location, csv_record)
+        :param csv_records: Iterable of ``CsvRecord``.
+        """
+        suffix = uuid.uuid4().hex[:8]
+        self.staging_tables = database.create_staging_tables(self.session, suffix)
+        try:
+            if self.chunk_size:
+                self._load_chunked(csv_records)
+            else:
+                self._load_all(csv_records)
+        except Exception:
+            database.drop_staging_tables(self.session, self.staging_tables)
+            raise
+        else:
+            database.swap_staging_tables(self.session, self.staging_tables, self.timestamp)
+        finally:
+            self.staging_tables = {}
+
+    def _load_all(self, csv_records):
+        """
+        Load all csv records into the store, and then replace the contents of
+        the database with the store in a single transaction.
 
-            extra_fields = dict(
-                location_id=location_id,
-                company_id=company_id,
-                job_title_id=job_title_id,
-                date_of_birth=csv_record.date_of_birth)
+        :param csv_records: Iterable of ``CsvRecord``.
+        """
+        self._set_phase('parse')
+        for csv_record in csv_records:
+            extra_fields = self._get_employee_fields(csv_record)
             self._model_factory(Employee, csv_record, lambda x: x.record_id, **extra_fields)
 
+        self._clear()
+
+        if self.bulk:
+            self._insert_bulk()
+        else:
+            self._set_phase('insert')
+            for cls_store in self.store.values():
+                self.session.add_all(x for x, _ in cls_store.values())
+
+        self.session.flush()
+        self._commit()
+
+        self._set_progress(len(self.store.get(Employee, ())))
+
+    def _load_chunked(self, csv_records):
+        """
+        Stream the csv records into the database, committing every
+        ``chunk_size`` employees together with any dimensions that were first
+        seen in that chunk. Only the dimensions are kept in the store, so
+        memory use does not depend on the number of employees.
+
+        As in ``_load_all`` employees are deduplicated on record id, the first
+        row of a record id is kept. Record ids already inserted by an earlier
+        chunk are looked up in the unique index on ``Employee.record_id``,
+        the insert ignores duplicates as well.
+
+        :param csv_records: Iterable of ``CsvRecord``.
+        """
+        self._clear()
+
+        table = self._get_table(Employee)
+        insert = table.insert().prefix_with('OR IGNORE')
+        n_inserted = collections.Counter()
+        employee_id = 0
+
+        while True:
+
+            self._set_phase('parse')
+            chunk = list(itertools.islice(csv_records, self.chunk_size))
+            if not chunk:
+                break
+
+            employees = collections.OrderedDict()
+            for csv_record in chunk:
+                extra_fields = self._get_employee_fields(csv_record)
+                if csv_record.record_id not in employees:
+                    employees[csv_record.record_id] = self._get_fields(Employee, csv_record, **extra_fields)
+
+            self._set_phase('dimension')
+            for model_cls, cls_store in self.store.items():
+                rows = itertools.islice(cls_store.values(), n_inserted[model_cls], None)
+                rows = [x for x, _ in rows]
+                if rows:
+                    self.session.execute(self._get_table(model_cls).insert(), rows)
+                n_inserted[model_cls] += len(rows)
+
+            self._set_phase('insert')
+            if employee_id:
+                for batch in batches(list(employees), self.batch_size):
+                    loaded = select([table.c.record_id]).where(table.c.record_id.in_(batch))
+                    for row in self.session.execute(loaded):
+                        del employees[row.record_id]
+
+            rows = []
+            for fields in employees.values():
+                employee_id += 1
+                rows.append(dict(fields, employee_id=employee_id))
+
+            for batch in batches(rows, self.batch_size):
+                self.session.execute(insert, batch)
+
+            self._set_phase('commit')
+            self.session.commit()
+
+            self._set_progress(employee_id)
+
+        self._commit()
+
+    def _load_incremental(self, csv_records):
+        """
+        Update the database with the difference between the csv records and
+        the employees in the database, using the record id as key. Existing
+        dimensions are reused and only the employees which are new, changed
+        or no longer present are written, in a single transaction. The
+        number of employees written is available in ``changes``.
+
+        The csv records are compared ``batch_size`` at a time with the
+        employees of the same record ids, found with the unique index on
+        ``Employee.record_id``. The record ids of the csv file are kept in a
+        temporary table, from which the employees that are no longer present
+        are found at the end. So only the changed employees are kept in
+        memory.
+
+        The date of birth is part of the comparison, so the same timestamp
+        should be given for a csv file as when it was first loaded, which is
+        what ``load`` does by default.
+
+        :param csv_records: Iterable of ``CsvRecord``.
+        """
+        self.changes = collections.Counter()
+
+        n_inserted = collections.Counter()
+        for model_cls in (JobTitle, Company, Location):
+            self._load_store(model_cls)
+            n_inserted[model_cls] = len(self.store[model_cls])
+
+        table = Employee.__table__
+        compared = [x.name for x in table.columns
+                    if x.name not in ('employee_id', 'record_id')]
+        update = table.update().where(table.c.employee_id == bindparam('_employee_id'))
+        employee_id = self.session.execute(select([func.max(table.c.employee_id)])).scalar() or 0
+
+        self.session.execute(f'drop table if exists temp.{record_ids.name}')
+        record_ids.create(self.session.connection())
+
+        # the fields the statistics depend on, the statistics are updated
+        # for the employees of which these were added or removed.
+        statistics_fields = ('company_id', 'job_title_id', 'location_id', 'date_of_birth_day')
+        get_statistics_fields = operator.itemgetter(*statistics_fields)
+
+        added, removed = [], []
+        n_records = n_inserts = n_updates = 0
+        while True:
+
+            self._set_phase('parse')
+            batch = list(itertools.islice(csv_records, self.batch_size))
+            if not batch:
+                break
+
+            employees = collections.OrderedDict()
+            for csv_record in batch:
+                extra_fields = self._get_employee_fields(csv_record)
+                if csv_record.record_id not in employees:
+                    employees[csv_record.record_id] = self._get_fields(Employee, csv_record, **extra_fields)
+
+            # the first row of a record id is kept, also when it was in an
+            # earlier batch.
+            seen = select([record_ids.c.record_id]).where(record_ids.c.record_id.in_(list(employees)))
+            for row in self.session.execute(seen):
+                del employees[row.record_id]
+
+            existing = {}
+            if employees:
+                self.session.execute(record_ids.insert(), [dict(record_id=x) for x in employees])
+                rows = select([table]).where(table.c.record_id.in_(list(employees)))
+                existing = {row.record_id: row for row in self.session.execute(rows)}
+            n_records += len(employees)
+
+            inserts, updates = [], []
+            for record_id, fields in employees.items():
+                row = existing.get(record_id)
+                if row is None:
+                    employee_id += 1
+                    inserts.append(dict(fields, employee_id=employee_id))
+                    added.append(fields)
+                elif any(fields[x] != row[x] for x in compared):
+                    updates.append(dict(fields, _employee_id=row.employee_id))
+                    previous = {x: row[x] for x in statistics_fields}
+                    if get_statistics_fields(fields) != get_statistics_fields(previous):
+                        added.append(fields)
+                        removed.append(previous)
+
+            self._set_phase('dimension')
+            for model_cls, cls_store in self.store.items():
+                rows = [x for x, _ in itertools.islice(cls_store.values(), n_inserted[model_cls], None)]
+                if rows:
+                    self.session.execute(model_cls.__table__.insert(), rows)
+                n_inserted[model_cls] += len(rows)
+
+            self._set_phase('insert')
+            if updates:
+                self.session.execute(update, updates)
+            if inserts:
+                self.session.execute(table.insert(), inserts)
+            n_inserts += len(inserts)
+            n_updates += len(updates)
+
+        self._set_phase('insert')
+        deleted = select([table]).where(~table.c.record_id.in_(select([record_ids.c.record_id])))
+        deletes = []
+        for row in self.session.execute(deleted):
+            deletes.append(row.employee_id)
+            removed.append({x: row[x] for x in statistics_fields})
+
+        for batch in batches(deletes, self.batch_size):
+            self.session.execute(table.delete().where(table.c.employee_id.in_(batch)))
+
+        self._commit(added, removed)
+        self.session.execute(f'drop table if exists temp.{record_ids.name}')
+        self.session.commit()
+
+        self.changes.update(inserted=n_inserts, updated=n_updates, deleted=len(deletes))
+        self._set_progress(n_records)
+
+    def _load_store(self, model_cls):
+        """
+        Fill the store of a model class with the rows already in the database,
+        so these are reused by ``_model_factory`` instead of created again.
+        Dimensions are never deleted so their ids run from 1 to the number
+        of rows, and new rows get the next ids.
+
+        :param model_cls: The model class to load the rows of.
+        """
+        table = model_cls.__table__
+        encoder = get_encoder(model_cls)
+
+        cls_store = self.store[model_cls] = collections.OrderedDict()
+        for row in self.session.execute(select([table]).order_by(table.c[encoder.primary_key])):
+            key = tuple(row[x] for x in encoder.columns)
+            cls_store[key] = dict(row), row[encoder.primary_key]
+
+    def _commit(self, added=None, removed=None):
+        """
+        Update the statistics for the loaded employees and commit. The
+        dataset generation is incremented in the same transaction, or when
+        the staging tables are swapped in if loading into staging tables.
+
+        :param added: When given only the statistics of the added and removed
+                      employees are updated, see
+                      ``update_changed_statistics``.
+        :param removed: The employees removed, when ``added`` is given.
+        """
+        self._set_phase('commit')
+        if added is None:
+            update_statistics(self.session, self.staging_tables)
+        else:
+            update_changed_statistics(self.session, added, removed)
+        if not self.staging_tables:
+            database.increment_generation(self.session, None if self.incremental else self.timestamp)
+        self.session.commit()
+
+    def _set_phase(self, name):
+        """
+        Report the phase the import enters to the ``phase`` callable, unless
+        the import is already in that phase.
+
+        :param name: The name of the phase, one of ``PHASES``.
+        """
+        if name != self.current_phase:
+            self.report.enter(name)
+            if self.phase:
+                self.phase(name)
+        self.current_phase = name
+
+    def _set_progress(self, n_rows):
+        """
+        Report the number of rows loaded so far to the ``progress`` callable.
+
+        :param n_rows: The number of rows loaded.
+        """
+        self.n_rows = n_rows
+        if self.progress:
+            self.progress(n_rows)
+
+    def _time_records(self, csv_records):
+        """
+        Measure the time spent reading csv records, which is part of the
+        parse phase.
+
+        :param csv_records: Iterable of ``CsvRecord``.
+
+        :return: Generator which when iterated yields the csv records.
+        """
+        clock = time.perf_counter
+        csv_records = iter(csv_records)
+        seconds = 0.0
+        try:
+            while True:
+                started_at = clock()
+                csv_record = next(csv_records, None)
+                seconds += clock() - started_at
+                if csv_record is None:
+                    return
+                yield csv_record
+        finally:
+            self.report.add_time('read', seconds)
+
+    def _get_employee_fields(self, csv_record):
+        """
+        Get the fields of an employee which are not directly in the csv
+        record, creating the dimensions the employee refers to if needed.
+
+        :param csv_record: Record containing employee data from the input csv
+
+        :return: dict containing the dimension ids and the day number of the
+                 date of birth.
+        """
+        date_of_birth_day = csv_record.date_of_birth_day
+        if date_of_birth_day is None:
+            started_at = time.perf_counter()
+            date_of_birth_day = csv_record.date_of_birth.toordinal()
+            self.report.add_time('date_of_birth', time.perf_counter() - started_at)
+
+        return dict(
+            job_title_id=self._model_factory(JobTitle, csv_record),
+            company_id=self._model_factory(Company, csv_record),
+            location_id=self._model_factory(Location, csv_record),
+            date_of_birth_day=date_of_birth_day,
+        )
+
+    def _get_table(self, model_cls):
+        """
+        Get the table to load the rows of a model class into.
+
+        :param model_cls: The model class to get the table for.
+
+        :return: The staging table while loading into staging tables,
+                 otherwise the table of ``model_cls``.
+        """
+        return self.staging_tables.get(model_cls.__table__, model_cls.__table__)
+
+    def _clear(self):
+        """
+        Make sure the tables that are loaded into are empty. Staging tables
+        are created empty, otherwise the live tables are cleared.
+        """
+        if not self.staging_tables:
+            self._delete_all()
+
+    def _delete_all(self):
+        """
+        Delete all records, together with the statistics and location paths
+        derived from these, and reset the autoincrement counters.
+        """
+        self._set_phase('delete')
+        for model_cls in (CompanyStatistics, CompanyAgeIndex, CompanyJobTitleStatistics,
+                          CompanyLocationStatistics, LocationPath):
+            self.session.query(model_cls).delete()
         self.session.query(Location).delete()
         self.session.query(JobTitle).delete()
         self.session.query(Company).delete()
@@ -96,11 +761,17 @@ class CsvSerializer(object):
         self.session.flush()
         self.session.commit()
 
-        for cls_store in self.store.values():
-            self.session.add_all(x for x, _ in cls_store.values())
-
-        self.session.flush()
-        self.session.commit()
+    def _insert_bulk(self):
+        """
+        Insert the rows in the store using Core ``insert`` statements executed
+        in batches of ``batch_size`` rows.
+        """
+        for model_cls, cls_store in self.store.items():
+            self._set_phase('insert' if model_cls is Employee else 'dimension')
+            insert = self._get_table(model_cls).insert()
+            rows = (x for x, _ in cls_store.values())
+            for batch in batches(rows, self.batch_size):
+                self.session.execute(insert, batch)
 
     def dump(self, fileobj, timestamp=datetime.datetime.now()):
         """
@@ -109,22 +780,42 @@ class CsvSerializer(object):
         :param fileobj: File like object where the csv records should be written.
         :param timestamp: The timestamp for calculating ages.
         """
+        for chunk in self.iter_dump(timestamp):
+            fileobj.write(chunk)
+
+    def iter_dump(self, timestamp=datetime.datetime.now()):
+        """
+        Dump the employee records to csv, as a generator of chunks of csv
+        data so the dump can be streamed. The employees are read with a
+        single joined query, ``batch_size`` rows at a time.
 
-        fileobj.write(',Job Title,Location,Location,Location,Location,Age,first_name,last_name,Company\n')
-        writer = csv.writer(fileobj, delimiter=',', lineterminator='\n')
+        :param timestamp: The timestamp for calculating ages.
+
+        :return: Generator which when iterated yields strings containing the
+                 csv header and then ``batch_size`` records at a time.
+        """
+        yield ',Job Title,Location,Location,Location,Location,Age,first_name,last_name,Company\n'
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=',', lineterminator='\n')
 
         factory = partial(self._csv_record_factory, timestamp=timestamp)
-        employees = self.session.query(Employee)
+        employees = (get_employees(self.session)
+                     .order_by(Employee.employee_id)
+                     .yield_per(self.batch_size))
         employees = map(factory, employees)
 
-        for employee in employees:
-            writer.writerow(employee)
+        for batch in batches(employees, self.batch_size):
+            writer.writerows(batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
 
     def _csv_record_factory(self, employee, timestamp):
         """
-        Create a csv record from an Employee model and the current timestamp
+        Create a csv record from an employee and the current timestamp
 
-        :param employee: instance of the Employee model
+        :param employee: employee row from the ``get_employees`` query.
         :param timestamp: timestamp to use for calculating the age.
 
         :return: list containing the following records for exporting to csv:
@@ -138,21 +829,21 @@ class CsvSerializer(object):
                     - age
                     - first_name
                     - last_name
-                    - company.company_name
+                    - company_name
         """
         result = []
         with contextlib.suppress(Exception):
             result = [
                 employee.employee_id,
-                employee.job_title.job_title,
-                employee.location.continent,
-                employee.location.country,
-                employee.location.state,
-                employee.location.city,
-                date_of_birth_to_age(employee.date_of_birth, timestamp),
+                employee.job_title,
+                employee.continent,
+                employee.country,
+                employee.state,
+                employee.city,
+                date_of_birth_to_age(datetime.date.fromordinal(employee.date_of_birth_day), timestamp),
                 employee.first_name,
                 employee.last_name,
-                employee.company.company_name,
+                employee.company_name,
             ]
         return result
 
@@ -160,9 +851,11 @@ class CsvSerializer(object):
         """
         Create an instance of a model (``model_cls``) from a csv record.
 
-        All fields from the csv record that are also present in the model class
-        are put into a dictionary with the additional fields and then used to
-        instantiate the model class as keyword arguments.
+        The values of the columns of the model class are taken from the csv
+        record, these are the key of the instance unless ``key`` is given.
+        Together with the additional fields the values are only turned into
+        keyword arguments to instantiate the model class for keys that were
+        not seen before.
 
         :param model_cls: The model class to instantiate.
         :param csv_record: Record containing employee data from the input csv
@@ -170,24 +863,41 @@ class CsvSerializer(object):
         :param extra_fields: Extra fields which should be used to instantiate
                              the class.
 
-        :return: An instance of ``model_cls`` created with data from csv_recod
+        :return: The id of the instance of ``model_cls`` created with data
+                 from csv_record. When loading in bulk the store contains a
+                 dictionary of column values instead of the instance.
         """
+        encoder = get_encoder(model_cls)
+
+        cls_store = self.store.get(model_cls)
+        if cls_store is None:
+            cls_store = self.store[model_cls] = collections.OrderedDict()
+
+        store_key = encoder.get_key(csv_record) if key is None else key(csv_record)
+        entry = cls_store.get(store_key)
+        if entry is None:
+            id = len(cls_store) + 1
+            fields = encoder.get_fields(csv_record, extra_fields)
+            if self.bulk:
+                # the primary key is given explicitly so that the ids are
+                # the same as those assigned by autoincrement in the orm path
+                fields[encoder.primary_key] = id
+                item = fields
+            else:
+                item = model_cls(**fields)
+            entry = cls_store[store_key] = item, id
+
+        return entry[1]
+
+    def _get_fields(self, model_cls, csv_record, **extra_fields):
+        """
+        Get the fields from the csv record and the additional fields that are
+        also columns of a model class.
 
-        fields = dict(csv_record.__dict__, **extra_fields)
-        fields = {
-            name: value
-            for name, value in fields.items()
-            if name in model_cls.__table__.columns
-        }
-
-        if model_cls not in self.store:
-            self.store[model_cls] = collections.OrderedDict()
-        cls_store = self.store[model_cls]
-
-        store_key = frozendict.frozendict(fields) if key is None else key(csv_record)
-        if store_key not in cls_store:
-            item = model_cls(**fields)
-            cls_store[store_key] = item, len(cls_store) + 1
+        :param model_cls: The model class to get the fields for.
+        :param csv_record: Record containing employee data from the input csv
+        :param extra_fields: Extra fields which should be included.
 
-        _, id = cls_store[store_key]
-        return id
+        :return: dict containing the values for the columns of ``model_cls``
+        """
+        return get_encoder(model_cls).get_fields(csv_record, extra_fields)
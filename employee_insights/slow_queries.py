@@ -0,0 +1,206 @@
+# std
+import os
+import re
+import json
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# statements which take at least this many seconds are logged together with
+# their parameters and query plan.
+SLOW_QUERY_SECONDS = float(os.environ.get('EMPLOYEE_INSIGHTS_SLOW_QUERY_SECONDS', 0.1))
+
+# the maximum number of query shapes of which statistics are kept, statements
+# of other shapes are not recorded once this many shapes were seen.
+MAX_QUERY_SHAPES = 1000
+
+# the bound parameters can contain personal data such as employee names, so
+# only their types are logged unless this is set, e.g. for debugging locally.
+LOG_PARAMETERS = bool(os.environ.get('EMPLOYEE_INSIGHTS_SLOW_QUERY_PARAMETERS'))
+
+# the bound parameters are logged up to this many characters.
+MAX_PARAMETERS_LENGTH = 1000
+
+
+def get_shape(statement):
+    """
+    Get the shape of a sql statement, which is the statement with normalized
+    whitespace and lists of parameters (as in ``IN (?, ?, ?)``) replaced by
+    a single parameter, so executions with a different number of values
+    have the same shape. The random suffix of staging tables is replaced as
+    well, see ``database.create_staging_tables``.
+
+    :param statement: The sql statement.
+
+    :return: str with the shape of the statement.
+    """
+    shape = re.sub(r'\?(\s*,\s*\?)+', '?, ...', ' '.join(statement.split()))
+    return re.sub(r'\b(\w+)_[0-9a-f]{8}\b', r'\1_<suffix>', shape)
+
+
+def redact(parameters):
+    """
+    Replace the values of bound parameters by their types.
+
+    :param parameters: The bound parameters, a sequence or dict of values or
+                       a sequence of these when executed for several sets of
+                       parameters.
+
+    :return: str like the repr of the parameters but with the type names
+             instead of the values, e.g. ``(str, int)``.
+    """
+    if isinstance(parameters, dict):
+        return '{' + ', '.join(f'{key!r}: {redact(value)}' for key, value in parameters.items()) + '}'
+    if isinstance(parameters, (list, tuple)):
+        # only the start is logged, see ``MAX_PARAMETERS_LENGTH``.
+        items = ', '.join(redact(x) for x in parameters[:MAX_PARAMETERS_LENGTH])
+        return f'[{items}]' if isinstance(parameters, list) else f'({items})'
+    return type(parameters).__name__
+
+
+def explain(cursor, statement, parameters):
+    """
+    Get the query plan of a statement with SQLite ``EXPLAIN QUERY PLAN``.
+
+    :param cursor: DBAPI cursor of the connection the statement was executed
+                   on.
+    :param statement: The sql statement.
+    :param parameters: The bound parameters of the statement.
+
+    :return: list of the lines of the query plan, indented by depth as shown
+             by the sqlite shell, or None when there is no query plan.
+    """
+    try:
+        rows = cursor.connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+    except Exception:
+        logger.debug('no query plan for %s', statement, exc_info=True)
+        return None
+
+    depths, plan = {0: 0}, []
+    for id, parent, _, detail in rows:
+        depths[id] = depths.get(parent, 0) + 1
+        plan.append('  ' * (depths[id] - 1) + detail)
+    return plan
+
+
+class QueryShape(object):
+    """
+    Execution statistics of the statements of one shape, with the parameters
+    and query plan of the slowest execution over the threshold.
+    """
+
+    def __init__(self, shape):
+        """
+        :param shape: The shape of the statements, see ``get_shape``.
+        """
+        self.shape = shape
+        self.queries = set()
+        self.count = 0
+        self.slow_count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.slowest = None
+
+    def as_dict(self):
+        return dict(
+            statement=self.shape,
+            queries=sorted(self.queries),
+            count=self.count,
+            slow_count=self.slow_count,
+            total_seconds=round(self.total_seconds, 6),
+            mean_seconds=round(self.total_seconds / self.count, 6),
+            max_seconds=round(self.max_seconds, 6),
+            slowest=self.slowest,
+        )
+
+
+class SlowQueryLog(object):
+    """
+    Log of the statements that take longer than a threshold, with the types
+    of their bound parameters, duration and query plan, and statistics of
+    all statements per shape since startup.
+    """
+
+    def __init__(self, threshold=SLOW_QUERY_SECONDS, max_shapes=MAX_QUERY_SHAPES,
+                 log_parameters=LOG_PARAMETERS):
+        """
+        :param threshold: Statements taking at least this many seconds are
+                          logged.
+        :param max_shapes: The maximum number of shapes to keep statistics of.
+        :param log_parameters: Whether the values of the bound parameters are
+                               logged instead of their types.
+        """
+        self.threshold = threshold
+        self.max_shapes = max_shapes
+        self.log_parameters = log_parameters
+        self.shapes = {}
+        self.lock = threading.Lock()
+
+    def observe(self, cursor, statement, parameters, seconds, query, executemany=False):
+        """
+        Record the execution of a statement, this is called after every
+        statement by ``employee_insights.metrics.after_cursor_execute``.
+
+        :param cursor: DBAPI cursor the statement was executed with.
+        :param statement: The sql statement.
+        :param parameters: The bound parameters, a sequence of parameters when
+                           ``executemany``.
+        :param seconds: The duration of the execution.
+        :param query: The name of the query function the statement was
+                      executed for.
+        :param executemany: Whether the statement was executed for several
+                            sets of parameters.
+        """
+        shape = get_shape(statement)
+        with self.lock:
+            query_shape = self.shapes.get(shape)
+            if query_shape is None:
+                if len(self.shapes) >= self.max_shapes:
+                    return
+                query_shape = self.shapes[shape] = QueryShape(shape)
+            query_shape.queries.add(query)
+            query_shape.count += 1
+            query_shape.total_seconds += seconds
+            query_shape.max_seconds = max(query_shape.max_seconds, seconds)
+
+        if seconds < self.threshold:
+            return
+
+        plan = explain(cursor, statement, parameters[0] if executemany and parameters else parameters)
+        slow_query = dict(
+            query=query,
+            seconds=round(seconds, 6),
+            statement=statement,
+            parameters=(repr(parameters) if self.log_parameters else redact(parameters))[:MAX_PARAMETERS_LENGTH],
+            plan=plan,
+        )
+        logger.warning('slow query %s', json.dumps(slow_query))
+
+        with self.lock:
+            query_shape.slow_count += 1
+            if query_shape.slowest is None or seconds > query_shape.slowest['seconds']:
+                query_shape.slowest = slow_query
+
+    def get_slowest(self, limit):
+        """
+        :param limit: The maximum number of shapes.
+
+        :return: list of dicts with the statistics of the ``limit`` shapes
+                 with the slowest executions, see ``QueryShape.as_dict``.
+        """
+        with self.lock:
+            shapes = sorted(self.shapes.values(), key=lambda x: x.max_seconds, reverse=True)
+            return [x.as_dict() for x in shapes[:limit]]
+
+    def clear(self):
+        """
+        Remove the statistics of all shapes.
+        """
+        with self.lock:
+            self.shapes.clear()
+
+
+slow_query_log = SlowQueryLog()
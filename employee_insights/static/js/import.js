@@ -1,8 +1,42 @@
 /**
  * Show the initial data in the database and set the upload success handler
- * on the dropzone.
+ * on the dropzone. Uploads are imported in the background, the status of the
+ * import is polled until it has finished.
  */
+var IMPORT_POLL_INTERVAL = 1000;
+
+
+function showImportStatus(status) {
+    var text = 'import ' + status.status;
+    if (status.phase) {
+        text += ' (' + status.phase + ')';
+    }
+    text += ': ' + status.rows + ' rows, ' + status.rows_per_second + ' rows/s';
+    if (status.error) {
+        text += ', ' + status.error;
+    }
+    $('#import-status').text(text);
+}
+
+
+function pollImport(url) {
+    $.get(url, function (status) {
+        showImportStatus(status);
+        if (status.status === 'done') {
+            loadResultTable();
+        } else if (status.status !== 'failed') {
+            setTimeout(function () { pollImport(url); }, IMPORT_POLL_INTERVAL);
+        }
+    });
+}
+
+
 $(document).ready(function () {
     loadResultTable();
-    Dropzone.options.importEmployeesCsv = { success: loadResultTable };
+    Dropzone.options.importEmployeesCsv = {
+        success: function (file, status) {
+            showImportStatus(status);
+            pollImport('/api/imports/' + status.job_id);
+        }
+    };
 });
\ No newline at end of file
@@ -0,0 +1,259 @@
+# std
+import collections
+# 3rd party
+from sqlalchemy import select, func, literal, and_, bindparam
+# local
+from employee_insights.models import *
+
+
+LOCATION_FIELDS = ('continent', 'country', 'state', 'city')
+
+# the maximum number of values bound in an ``IN`` list when updating the
+# statistics of an incremental import, SQLite limits the number of
+# parameters of a statement.
+MAX_IN_VALUES = 500
+
+
+def split(values, size=None):
+    """
+    Split a list of values for binding in ``IN`` lists.
+
+    :param values: list of values.
+    :param size: The maximum number of values per list, defaults to
+                 ``MAX_IN_VALUES``.
+
+    :return: list of lists of at most ``size`` values.
+    """
+    size = size or MAX_IN_VALUES
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def update_statistics(session, tables=None):
+    """
+    Fill the statistics tables from the employees, replacing any previous
+    statistics. This is done once on import so that the analytics queries
+    only have to read a row per company instead of scanning all employees.
+
+    :param session: SQLAlchemy session to use for updating the statistics.
+    :param tables: dict mapping tables of the schema to the tables which
+                   should be used in their place, for example staging tables.
+                   Tables which are not in the dict are used as is.
+    """
+    tables = tables or {}
+    get_table = lambda x: tables.get(x.__table__, x.__table__)
+
+    employee = get_table(Employee)
+    location_path = get_table(LocationPath)
+    company_statistics = get_table(CompanyStatistics)
+    age_index = get_table(CompanyAgeIndex)
+    job_title_statistics = get_table(CompanyJobTitleStatistics)
+    location_statistics = get_table(CompanyLocationStatistics)
+
+    update_location_paths(session, tables)
+
+    for table in (company_statistics, age_index, job_title_statistics, location_statistics):
+        session.execute(table.delete())
+
+    # the positions are the rowids, which are assigned in the order of
+    # insertion.
+    session.execute(age_index.insert().from_select(
+        ['company_id', 'date_of_birth_day'],
+        select([employee.c.company_id, employee.c.date_of_birth_day])
+        .order_by(employee.c.company_id, employee.c.date_of_birth_day)
+    ))
+
+    session.execute(company_statistics.insert().from_select(
+        ['company_id', 'employee_count', 'first_position', 'date_of_birth_sum'],
+        select([
+            age_index.c.company_id,
+            func.count(),
+            func.min(age_index.c.position),
+            func.sum(age_index.c.date_of_birth_day),
+        ]).group_by(age_index.c.company_id)
+    ))
+
+    session.execute(job_title_statistics.insert().from_select(
+        ['company_id', 'job_title_id', 'employee_count'],
+        select([
+            employee.c.company_id,
+            employee.c.job_title_id,
+            func.count(),
+        ]).group_by(employee.c.company_id, employee.c.job_title_id)
+    ))
+
+    # every employee is counted for each of the paths of its location
+    session.execute(location_statistics.insert().from_select(
+        ['company_id', 'depth', 'path', 'employee_count'],
+        select([
+            employee.c.company_id,
+            location_path.c.depth,
+            location_path.c.path,
+            func.count(),
+        ])
+        .select_from(employee.join(location_path,
+                                   employee.c.location_id == location_path.c.location_id))
+        .group_by(employee.c.company_id, location_path.c.depth, location_path.c.path)
+    ))
+
+
+def update_changed_statistics(session, added, removed):
+    """
+    Update the statistics tables for the employees which were added to and
+    removed from the database since the statistics were last updated, for
+    an incremental import. The counts per job title and location are
+    adjusted by the differences, the age index and the statistics of a
+    company are only rebuilt when employees of that company changed.
+
+    This must be called after the employees were written, an updated
+    employee is removed with its previous values and added with its new
+    values.
+
+    :param session: SQLAlchemy session to use for updating the statistics.
+    :param added: Iterable of dicts with the ``company_id``,
+                  ``job_title_id``, ``location_id`` and
+                  ``date_of_birth_day`` of the employees added.
+    :param removed: Iterable of dicts with the same fields of the
+                    employees removed.
+    """
+    update_location_paths(session, replace=False)
+
+    changes = [(1, x) for x in added] + [(-1, x) for x in removed]
+    if not changes:
+        return
+
+    company_ids = sorted(set(x['company_id'] for _, x in changes))
+    update_age_index(session, company_ids)
+
+    job_title_counts = collections.Counter()
+    for sign, employee in changes:
+        job_title_counts[employee['company_id'], employee['job_title_id']] += sign
+    add_counts(session, CompanyJobTitleStatistics.__table__, job_title_counts, company_ids)
+
+    location_ids = sorted(set(x['location_id'] for _, x in changes))
+    paths = collections.defaultdict(list)
+    for batch in split(location_ids):
+        for row in session.execute(
+                select([LocationPath.location_id, LocationPath.depth, LocationPath.path])
+                .where(LocationPath.location_id.in_(batch))):
+            paths[row.location_id].append((row.depth, row.path))
+
+    location_counts = collections.Counter()
+    for sign, employee in changes:
+        for depth, path in paths[employee['location_id']]:
+            location_counts[employee['company_id'], depth, path] += sign
+    add_counts(session, CompanyLocationStatistics.__table__, location_counts, company_ids)
+
+
+def update_age_index(session, company_ids):
+    """
+    Rebuild the age index and the statistics of some companies. The
+    positions of the employees of a company are numbered after the last
+    position in the index, the positions of a company stay consecutive,
+    which is all the analytics queries depend on.
+
+    :param session: SQLAlchemy session to use for updating the index.
+    :param company_ids: Sorted list of the ids of the companies to rebuild,
+                        these are rebuilt ``MAX_IN_VALUES`` at a time.
+    """
+    employee = Employee.__table__
+    age_index = CompanyAgeIndex.__table__
+    company_statistics = CompanyStatistics.__table__
+
+    for batch in split(company_ids):
+        session.execute(age_index.delete().where(age_index.c.company_id.in_(batch)))
+        session.execute(company_statistics.delete().where(company_statistics.c.company_id.in_(batch)))
+
+        session.execute(age_index.insert().from_select(
+            ['company_id', 'date_of_birth_day'],
+            select([employee.c.company_id, employee.c.date_of_birth_day])
+            .where(employee.c.company_id.in_(batch))
+            .order_by(employee.c.company_id, employee.c.date_of_birth_day)
+        ))
+
+        session.execute(company_statistics.insert().from_select(
+            ['company_id', 'employee_count', 'first_position', 'date_of_birth_sum'],
+            select([
+                age_index.c.company_id,
+                func.count(),
+                func.min(age_index.c.position),
+                func.sum(age_index.c.date_of_birth_day),
+            ])
+            .where(age_index.c.company_id.in_(batch))
+            .group_by(age_index.c.company_id)
+        ))
+
+
+def add_counts(session, table, counts, company_ids):
+    """
+    Add differences to the employee counts of a statistics table, rows are
+    inserted for new keys and removed when their count drops to zero.
+
+    :param session: SQLAlchemy session to use for updating the counts.
+    :param table: The statistics table, with ``employee_count`` and a
+                  primary key starting with ``company_id``.
+    :param counts: ``collections.Counter`` of primary key tuples to the
+                   difference of their count.
+    :param company_ids: The ids of the companies in ``counts``.
+    """
+    key_columns = list(table.primary_key.columns)
+    existing = set(
+        tuple(row)
+        for batch in split(company_ids)
+        for row in session.execute(select(key_columns).where(table.c.company_id.in_(batch)))
+    )
+
+    updates, inserts = [], []
+    for key, count in counts.items():
+        if not count:
+            continue
+        fields = {x.name: value for x, value in zip(key_columns, key)}
+        if key in existing:
+            updates.append(dict({'_' + x: value for x, value in fields.items()}, count=count))
+        else:
+            inserts.append(dict(fields, employee_count=count))
+
+    if updates:
+        session.execute(
+            table.update()
+            .where(and_(*(x == bindparam('_' + x.name) for x in key_columns)))
+            .values(employee_count=table.c.employee_count + bindparam('count')),
+            updates)
+    if inserts:
+        session.execute(table.insert(), inserts)
+    for batch in split(company_ids):
+        session.execute(table.delete().where(table.c.company_id.in_(batch))
+                                      .where(table.c.employee_count <= 0))
+
+
+def update_location_paths(session, tables=None, replace=True):
+    """
+    Fill the location paths from the locations, replacing any previous
+    paths. Every location gets a path for each level of the hierarchy, so
+    finding the locations under a path is an index lookup.
+
+    :param session: SQLAlchemy session to use for updating the paths.
+    :param tables: dict mapping tables of the schema to the tables which
+                   should be used in their place, see ``update_statistics``.
+    :param replace: When False the previous paths are kept and only the
+                    locations without paths get these, as locations are
+                    never removed by an incremental import.
+    """
+    tables = tables or {}
+    location = tables.get(Location.__table__, Location.__table__)
+    location_path = tables.get(LocationPath.__table__, LocationPath.__table__)
+
+    if replace:
+        session.execute(location_path.delete())
+
+    for depth in range(1, len(LOCATION_FIELDS) + 1):
+        path = location.c[LOCATION_FIELDS[0]]
+        for field in LOCATION_FIELDS[1:depth]:
+            path = path + '/' + location.c[field]
+        name = func.rtrim(path, '/') if depth == len(LOCATION_FIELDS) else path
+        paths = select([location.c.location_id, literal(depth), path.label('path'), name.label('name')])
+        if not replace:
+            paths = paths.where(~location.c.location_id.in_(
+                select([location_path.c.location_id]).where(location_path.c.depth == depth)))
+        session.execute(location_path.insert().from_select(
+            ['location_id', 'depth', 'path', 'name'], paths
+        ))
@@ -1,10 +1,7 @@
 # std
-import io
 import datetime
-from codecs import getwriter
-from contextlib import closing
 # 3rd party
-from flask import render_template, send_file, Blueprint
+from flask import render_template, Blueprint, Response, stream_with_context
 # local
 from employee_insights.serializer import CsvSerializer
 from employee_insights import database
@@ -19,15 +16,23 @@ def age():
     return render_template('age.html')
 
 
+@views.route('/age_quantiles')
+def age_quantiles():
+    return render_template('age_quantiles.html')
+
+
+@views.route('/age_distribution')
+def age_distribution():
+    return render_template('age_distribution.html')
+
+
 @views.route('/export')
 def export():
-    fileobj = getwriter('utf-8')(io.BytesIO())
-    with closing(database.get_session()) as session:
-        CsvSerializer(session).dump(fileobj)
-    fileobj.seek(0)
+    dump = CsvSerializer(database.get_session()).iter_dump(datetime.datetime.now())
     filename = datetime.datetime.now().strftime('%Y%m%d_%H%M%S.csv')
-    return send_file(fileobj, as_attachment=True,
-                     attachment_filename=filename, mimetype='text/csv')
+    return Response(stream_with_context(dump), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+    })
 
 
 @views.route('/import')
@@ -40,6 +45,11 @@ def index():
     return render_template('index.html')
 
 
+@views.route('/location_rollup')
+def location_rollup():
+    return render_template('location_rollup.html')
+
+
 @views.route('/job_title')
 def job_title():
     return render_template('job_title.html')
@@ -47,6 +57,5 @@ def job_title():
 
 @views.route('/location')
 def location():
-    with closing(database.get_session()) as session:
-        locations = [x[0] for x in get_locations(session)]
+    locations = [x[0] for x in get_locations(database.get_session())]
     return render_template('location.html', locations=locations)
@@ -6,6 +6,8 @@ from unittest.mock import patch
 from table2dicts import table2dicts
 from neobunch import NeoBunch as Bunch
 # local
+from employee_insights import database
+from employee_insights.api import result_cache
 from tests.strategies import import_data
 
 
@@ -50,6 +52,11 @@ def perform_integration_test(data, page, page_name, get_expected, compare_functi
     with patch('employee_insights.database.get_url', get_url), \
          patch('employee_insights.database.import_data', data_importer):
 
+            # engines are cached per url, so make sure the in-memory database
+            # is created and filled again with the data for this example.
+            database.dispose_engines()
+            result_cache.clear()
+
             if page.current_path != '/' + page_name:
                 page.visit(page_name)
 
@@ -5,7 +5,10 @@ import pytest
 import capybara
 import capybara.dsl
 # local
+from employee_insights import database
 from employee_insights.app import app
+from employee_insights.api import result_cache
+from employee_insights.serializer import CsvSerializer
 
 
 # setup capybara / selenium
@@ -27,4 +30,37 @@ def page():
     """
     if capybara.app != app:
         capybara.app = app
-    return capybara.dsl.page
\ No newline at end of file
+    return capybara.dsl.page
+
+
+data_set_path = os.path.join(__dir__, 'data', 'DataSet_0.csv')
+
+
+@pytest.fixture
+def client(tmpdir, monkeypatch):
+    """
+    Create a Flask test client for testing the api, with a database file in
+    a temporary directory. Call ``load_data_set`` to fill the database.
+
+    :return: The Flask test client.
+    """
+    monkeypatch.setattr(database, 'database_path', str(tmpdir.join('employee_insights.db')))
+    database.dispose_engines()
+    result_cache.clear()
+    yield app.test_client()
+    database.dispose_engines()
+    result_cache.clear()
+
+
+def load_data_set(timestamp=None):
+    """
+    Load the test data set into the database of the ``client`` fixture. The
+    result cache is cleared, as it is not updated by imports which are not
+    done through the api.
+
+    :param timestamp: The timestamp to assume for calculating ages.
+    """
+    with database.closing_session(database.get_engine()) as session, \
+         open(data_set_path, encoding='utf-8') as load:
+        CsvSerializer(session, bulk=True).load(load, timestamp)
+    result_cache.clear()
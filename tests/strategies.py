@@ -19,6 +19,7 @@ from neobunch import NeoBunch as Bunch
 import yaml
 # local
 from employee_insights.models import *
+from employee_insights.statistics import update_statistics
 
 
 class EmployeeData(object):
@@ -229,6 +230,7 @@ def import_data(data, session):
 
     session.add_all(items)
     session.flush()
+    update_statistics(session)
     session.commit()
 
 
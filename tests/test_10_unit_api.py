@@ -0,0 +1,297 @@
+# std
+import io
+import os
+import json
+import time
+import base64
+import datetime
+import tempfile
+# 3rd party
+import pytest
+from sqlalchemy import event
+from werkzeug.http import http_date
+# local
+from employee_insights import database, metrics, jobs, api
+from employee_insights.api import MAX_CURVE_YEARS, MAX_PAGE_SIZE, result_cache
+from tests.fixtures import client, load_data_set, data_set_path
+
+
+def test_streamed_response(client, monkeypatch):
+    """
+    Verify that a json response is streamed in chunks of
+    ``STREAM_BATCH_SIZE`` records which together are a json list of the
+    records, also when there are no records.
+    """
+    response = client.get('/api/employees')
+    assert response.status_code == 200
+    assert response.get_json() == []
+
+    load_data_set()
+    monkeypatch.setattr(api, 'STREAM_BATCH_SIZE', 100)
+
+    response = client.get('/api/employees', buffered=False)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/json'
+    chunks = list(response.response)
+    response.close()
+    assert len(chunks) == 9
+
+    employees = json.loads(b''.join(chunks))
+    assert len(employees) == 714
+    assert set(employees[0]) == {'employee_id', 'job_title', 'continent', 'country', 'state', 'city',
+                                 'age', 'first_name', 'last_name', 'company_name'}
+    assert [x['employee_id'] for x in employees] == list(range(1, 715))
+
+
+@pytest.mark.parametrize('query', [
+    'start=-1e308&stop=1e308',
+    'start=0&stop=1&step=1e-320',
+    f'start=0&stop={MAX_CURVE_YEARS}&step=1',
+    'start=1&stop=0',
+    'start=0&stop=1&step=0',
+    'start=0&stop=nan',
+])
+def test_curve_invalid_range(client, query):
+    """
+    Verify that a range of years which is invalid or gives too many values
+    is rejected, also when the number of values does not fit in a float.
+    """
+    response = client.get(f'/api/employees/percentage_older_than_average_curve?{query}')
+    assert response.status_code == 400
+
+
+def test_curve(client):
+    """
+    Verify that the curve gives the percentages of the single threshold
+    endpoint for every company and number of years.
+    """
+    load_data_set()
+    years = [-5, 0, 5]
+
+    response = client.get('/api/employees/percentage_older_than_average_curve'
+                          f'?start={years[0]}&stop={years[-1]}&step=5')
+    assert response.status_code == 200
+    curve = response.get_json()
+    assert [x['years'] for x in curve[:3]] == years
+
+    for n_years in years:
+        response = client.get(f'/api/employees/percentage_older_than_average?years={n_years}')
+        expected = {x['company_name']: x['percentage_older'] for x in response.get_json()}
+        actual = {x['company_name']: x['percentage_older'] for x in curve if x['years'] == n_years}
+        assert actual == expected
+
+
+def test_employees_pages(client):
+    """
+    Verify that following the ``X-Next-Cursor`` header gives all employees
+    exactly once, and that it is absent on the last page.
+    """
+    load_data_set()
+    expected = [x['employee_id'] for x in client.get('/api/employees').get_json()]
+
+    actual, url = [], '/api/employees?limit=300'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= 300
+        actual += [x['employee_id'] for x in page]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = cursor and f'/api/employees?limit=300&after={cursor}'
+
+    assert len(expected) == 714
+    assert actual == expected
+
+
+def encode(value):
+    """
+    :return: A cursor with ``value`` encoded as ``encode_cursor`` does.
+    """
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.mark.parametrize('query', [
+    'limit=0',
+    'limit=-1',
+    f'limit={MAX_PAGE_SIZE + 1}',
+    'limit=1' + '0' * 30,
+    'limit=ten',
+    'after=invalid',
+    'after=' + encode({'employee_id': 2 ** 63}),
+    'after=' + encode({'employee_id': -1}),
+    'after=' + encode({'employee_id': None}),
+    'after=' + encode({'id': 1}),
+    'after=' + encode(1),
+])
+def test_employees_invalid_page(client, query):
+    """
+    Verify that a limit out of range and an invalid cursor are rejected.
+    """
+    assert client.get(f'/api/employees?{query}').status_code == 400
+
+
+@pytest.mark.parametrize('query, status_code', [
+    ('', 200),
+    ('limit=1', 200),
+    ('limit=0', 400),
+    ('limit=-3', 400),
+    ('limit=ten', 400),
+])
+def test_slow_queries_limit(client, query, status_code):
+    """
+    Verify that the slow queries are listed up to a positive limit, and that
+    another limit is rejected.
+    """
+    response = client.get(f'/api/admin/slow_queries?{query}')
+    assert response.status_code == status_code
+    if status_code == 200:
+        assert len(response.get_json()['queries']) <= int(query.partition('=')[2] or 10)
+
+
+def test_conditional_requests(client, monkeypatch):
+    """
+    Verify that a cacheable result has validators, that a request with a
+    matching ``If-None-Match`` or a later ``If-Modified-Since`` gets a 304
+    without executing any sql statement, and that other requests get the
+    result.
+    """
+    load_data_set()
+    url = '/api/employees/percentage_older_than_average?years=1'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    last_modified = response.headers['Last-Modified']
+    assert response.headers['Cache-Control'] == 'no-cache'
+    result = response.get_json()
+    assert result
+
+    statements = []
+    monkeypatch.setattr(result_cache, 'generation_ttl', 60)
+    event.listen(database.get_engine(), 'before_cursor_execute', lambda *args: statements.append(args))
+
+    response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    assert not response.data
+
+    response = client.get(url, headers={'If-Modified-Since': last_modified})
+    assert response.status_code == 304
+
+    assert not statements
+
+    response = client.get(url, headers={'If-None-Match': '"other"'})
+    assert response.status_code == 200
+    assert response.get_json() == result
+
+    earlier = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=1)
+    response = client.get(url, headers={'If-Modified-Since': http_date(earlier)})
+    assert response.status_code == 200
+    assert response.get_json() == result
+
+    response = client.get(url + '0', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+
+
+def test_metrics(client):
+    """
+    Verify that the requests and the sql statements of a page of employees
+    are measured per endpoint and query function, and exposed in the text
+    format.
+    """
+    load_data_set()
+    metrics.metrics.clear()
+
+    response = client.get('/api/employees?limit=10')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 10
+    assert client.get('/api/employees?limit=0').status_code == 400
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+
+    assert '# TYPE employee_insights_requests_total counter' in lines
+    assert 'employee_insights_requests_total{endpoint="api.employees_get",method="GET",status="200"} 1' \
+        in lines
+    assert 'employee_insights_requests_total{endpoint="api.employees_get",method="GET",status="400"} 1' \
+        in lines
+    assert 'employee_insights_query_rows_total{query="get_employees"} 10' in lines
+    assert any(x.startswith('employee_insights_query_duration_seconds_count{query="get_employees"}')
+               for x in lines)
+    assert not any('<lambda>' in x for x in lines)
+    assert any(x.startswith('employee_insights_pool_size{') for x in lines)
+    metrics.metrics.clear()
+
+
+def wait_for_import(client, url, timeout=30):
+    """
+    Poll the status of an import job until it is finished.
+
+    :return: dict with the status of the finished job.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        status = response.get_json()
+        if status['status'] in ('done', 'failed') or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def test_import(client):
+    """
+    Verify that an upload is accepted with the url of the import job, which
+    reports the import until it is done, after which the employees are
+    returned.
+    """
+    with open(data_set_path, 'rb') as f:
+        response = client.post('/api/employees', data=dict(file=(f, 'DataSet_0.csv')))
+    assert response.status_code == 202
+    assert response.get_json()['status'] in ('queued', 'running', 'done')
+    url = response.headers['Location']
+    assert url.endswith('/api/imports/' + response.get_json()['job_id'])
+
+    status = wait_for_import(client, url)
+    assert status['status'] == 'done'
+    assert status['error'] is None
+    assert status['rows'] == 714
+    assert status['report']['rows'] == 714
+
+    response = client.get('/api/employees')
+    assert response.status_code == 200
+    assert len(response.get_json()) == 714
+
+    assert client.get('/api/imports/unknown').status_code == 404
+
+
+def test_import_failure(client, tmpdir, monkeypatch):
+    """
+    Verify that the uploaded file is removed when it could not be saved or
+    submitted, and that a failed import is reported by the import job.
+    """
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmpdir.mkdir('uploads')))
+
+    assert client.post('/api/employees', data={}).status_code == 400
+    assert not os.listdir(tempfile.tempdir)
+
+    def submit_import(*args):
+        raise RuntimeError('no import workers')
+
+    with monkeypatch.context() as m:
+        m.setattr(jobs, 'submit_import', submit_import)
+        with open(data_set_path, 'rb') as f:
+            response = client.post('/api/employees', data=dict(file=(f, 'DataSet_0.csv')))
+    assert response.status_code == 500
+    assert not os.listdir(tempfile.tempdir)
+
+    invalid = b',Job Title,Location,Location,Location,Location,Age,first_name,last_name,Company\n1,2\n'
+    response = client.post('/api/employees', data=dict(file=(io.BytesIO(invalid), 'invalid.csv')))
+    assert response.status_code == 202
+    status = wait_for_import(client, response.headers['Location'])
+    assert status['status'] == 'failed'
+    assert status['error']
+    assert not os.listdir(tempfile.tempdir)
@@ -0,0 +1,100 @@
+# std
+import io
+# 3rd party
+from sqlalchemy import event
+# local
+from employee_insights import database
+from employee_insights.api import result_cache
+from employee_insights.cache import ResultCache
+from tests.fixtures import client, load_data_set, data_set_path
+from tests.test_10_unit_api import wait_for_import
+
+
+def test_eviction():
+    """
+    Verify that the least recently used result is evicted when the cache is
+    full, and that results larger than the maximum size are not cached.
+    """
+    cache = ResultCache(max_entries=2, max_entry_size=10)
+    cache.set('a', '[1]')
+    cache.set('b', '[2]')
+    assert cache.get('a') == '[1]'
+    cache.set('c', '[3]')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == '[1]'
+    assert cache.get('c') == '[3]'
+
+    cache.set('d', '[' + '1' * 10 + ']')
+    assert cache.get('d') is None
+    assert cache.get_statistics() == dict(hits=3, misses=2, entries=2, generation=None)
+
+
+def test_generation():
+    """
+    Verify that setting another generation evicts the results of the
+    previous generation.
+    """
+    cache = ResultCache()
+    cache.set_generation(1, None)
+    cache.set('a', '[1]')
+    cache.set_generation(1, None)
+    assert cache.get('a') == '[1]'
+    cache.set_generation(2, None)
+    assert cache.get('a') is None
+
+
+def test_cached_response(client, monkeypatch):
+    """
+    Verify that a result is served from the cache without executing any sql
+    statement, with the hits and misses counted in the cache statistics,
+    and that it is computed again after an import.
+    """
+    load_data_set()
+    monkeypatch.setattr(result_cache, 'hits', 0)
+    monkeypatch.setattr(result_cache, 'misses', 0)
+    url = '/api/employees/percentage_per_job_title'
+
+    statements = []
+    event.listen(database.get_engine(), 'before_cursor_execute', lambda *args: statements.append(args))
+
+    result = client.get(url).get_json()
+    assert statements
+    assert client.get('/api/cache').get_json() == dict(hits=0, misses=1, entries=1, generation=1)
+
+    statements.clear()
+    assert client.get(url).get_json() == result
+    assert not statements
+    assert client.get('/api/cache').get_json() == dict(hits=1, misses=1, entries=1, generation=1)
+
+    with open(data_set_path, encoding='utf-8') as f:
+        data = ''.join(f.readlines()[:101]).encode('utf-8')
+    response = client.post('/api/employees', data=dict(file=(io.BytesIO(data), 'part.csv')))
+    assert wait_for_import(client, response.headers['Location'])['status'] == 'done'
+    assert client.get('/api/cache').get_json() == dict(hits=1, misses=1, entries=0, generation=2)
+
+    statements.clear()
+    changed = client.get(url).get_json()
+    assert statements
+    assert changed != result
+    assert client.get('/api/cache').get_json() == dict(hits=1, misses=2, entries=1, generation=2)
+
+
+def test_uncached_responses(client, monkeypatch):
+    """
+    Verify that pages of employees and results larger than the maximum
+    entry size are not cached.
+    """
+    load_data_set()
+
+    response = client.get('/api/employees?limit=10')
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
+    assert client.get('/api/employees?limit=10').get_json() == response.get_json()
+    assert result_cache.get_statistics()['entries'] == 0
+
+    monkeypatch.setattr(result_cache, 'max_entry_size', 100)
+    response = client.get('/api/employees/percentage_per_job_title')
+    assert response.status_code == 200
+    assert len(response.get_data()) > 100
+    assert result_cache.get_statistics()['entries'] == 0
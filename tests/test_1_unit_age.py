@@ -8,8 +8,10 @@ from toolz.itertoolz import count
 # 3rd party
 import pytest
 from hypothesis import strategies as st, given, settings
+from sqlalchemy import event
 # local
-from employee_insights.queries import get_employees_percentage_older_than_average
+from employee_insights.queries import get_employees_percentage_older_than_average, \
+    get_employees_percentage_older_than_average_curve, get_age_quantiles, get_age_distribution
 from tests.strategies import employee_databases
 from tests.common import get_company_employees
 
@@ -94,3 +96,176 @@ def test_get_employees_percentage_older_than_average(employee_database, years):
             assert 0 <= company.percentage_older <= 100
             expected_company = employee_data.companies[company.company_id-1]
             assert company.company_name == expected_company.company_name
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.integers(min_value=0, max_value=10))
+def test_get_employees_percentage_older_than_average_as_of(employee_database, years):
+    """
+    Verify that get_employees_percentage_older_than_average calculates the
+    average age at the given date instead of the current date.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param years: Find percentage of employees this number of years older
+                    than the company-wide average.
+    """
+    employee_data, session = employee_database
+
+    actual_result = get_employees_percentage_older_than_average(session, years, as_of=today)
+    actual_result = sorted(actual_result)
+    expected_result = sorted(get_expected(employee_data, years))
+
+    for actual, expected, in itertools.zip_longest(actual_result, expected_result):
+        assert actual.company_id == expected.company_id
+        assert pytest.approx(actual.average_employee_age) == expected.average_employee_age
+        assert pytest.approx(float(actual.percentage_older), 0.1) == expected.percentage_older
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.lists(st.floats(min_value=-100, max_value=100), max_size=5))
+def test_get_employees_percentage_older_than_average_curve(employee_database, years):
+    """
+    Verify that get_employees_percentage_older_than_average_curve gives the
+    same percentages as get_employees_percentage_older_than_average for each
+    number of years.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param years: The numbers of years older than the company-wide average.
+    """
+    employee_data, session = employee_database
+
+    actual_result = get_employees_percentage_older_than_average_curve(session, years, as_of=today)
+    expected_result = [
+        x + (n_years,)
+        for n_years in years
+        for x in get_employees_percentage_older_than_average(session, n_years, as_of=today)
+    ]
+
+    actual_result = sorted((x.company_id, x.company_name, x.average_employee_age,
+                            x.percentage_older, x.years) for x in actual_result)
+    assert actual_result == sorted(expected_result)
+
+
+@settings(max_examples=10)
+@given(employee_databases(), st.integers(min_value=1, max_value=40))
+def test_get_employees_percentage_older_than_average_curve_statements(employee_database, n_years):
+    """
+    Verify that get_employees_percentage_older_than_average_curve executes
+    the same number of statements for any number of years.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param n_years: The number of years values of the curve.
+    """
+    employee_data, session = employee_database
+
+    def count_statements(years):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(session.get_bind(), 'before_cursor_execute', listener)
+        try:
+            get_employees_percentage_older_than_average_curve(session, years, as_of=today)
+        finally:
+            event.remove(session.get_bind(), 'before_cursor_execute', listener)
+        return len(statements)
+
+    assert count_statements([0]) == count_statements(range(n_years)) == 2
+
+
+def calc_ages(employees):
+    """
+    Calculate the ages of employees at ``today`` using python.
+
+    :param employees: The employees to calculate the ages of.
+
+    :return: Sorted list of ages.
+    """
+    return sorted((today - x.date_of_birth).days / 365.25 for x in employees)
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.lists(st.floats(min_value=0, max_value=1), min_size=1, max_size=5))
+def test_get_age_quantiles(employee_database, quantiles):
+    """
+    Verify that get_age_quantiles gives the linearly interpolated quantiles
+    of the ages calculated in python.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param quantiles: The quantiles to get.
+    """
+    employee_data, session = employee_database
+
+    actual_result = get_age_quantiles(session, quantiles, as_of=today)
+
+    expected_result = []
+    for company, company_employees in get_company_employees(employee_data):
+        ages = calc_ages(company_employees)
+        for quantile in quantiles:
+            index = quantile * (len(ages) - 1)
+            lower = int(index)
+            upper = min(lower + 1, len(ages) - 1)
+            age = ages[lower] + (ages[upper] - ages[lower]) * (index - lower)
+            expected_result.append((company.company_id, company.company_name, quantile, age))
+
+    assert len(actual_result) == len(expected_result)
+    for actual, expected in zip(actual_result, expected_result):
+        assert actual[:3] == expected[:3]
+        assert pytest.approx(actual.age) == expected[3]
+
+
+@settings(max_examples=10)
+@given(employee_databases(), st.lists(st.floats(min_value=0, max_value=1), min_size=1, max_size=20))
+def test_get_age_quantiles_statements(employee_database, quantiles):
+    """
+    Verify that get_age_quantiles executes a single statement for any number
+    of quantiles.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param quantiles: The quantiles to get.
+    """
+    employee_data, session = employee_database
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(session.get_bind(), 'before_cursor_execute', listener)
+    try:
+        get_age_quantiles(session, quantiles, as_of=today)
+    finally:
+        event.remove(session.get_bind(), 'before_cursor_execute', listener)
+
+    assert len(statements) == 1
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.lists(st.integers(min_value=0, max_value=120), min_size=2, max_size=5))
+def test_get_age_distribution(employee_database, ages):
+    """
+    Verify that get_age_distribution gives the percentage of employees in
+    each age group calculated in python.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param ages: The boundaries of the age groups.
+    """
+    employee_data, session = employee_database
+    ages = sorted(ages)
+
+    actual_result = get_age_distribution(session, ages, as_of=today)
+
+    expected_result = []
+    for company, company_employees in get_company_employees(employee_data):
+        employee_ages = calc_ages(company_employees)
+        for min_age, max_age in zip(ages, ages[1:]):
+            n_employees = count(x for x in employee_ages if min_age < x <= max_age)
+            percentage = 100.0 * n_employees / len(employee_ages)
+            expected_result.append((company.company_id, company.company_name,
+                                    min_age, max_age, percentage))
+
+    assert len(actual_result) == len(expected_result)
+    for actual, expected in zip(actual_result, expected_result):
+        assert actual[:4] == expected[:4]
+        assert pytest.approx(actual.percentage) == expected[4]
@@ -8,7 +8,8 @@ from hypothesis import strategies as st, given, settings
 from neobunch import NeoBunch as Bunch
 from toolz.itertoolz import count
 # local
-from employee_insights.queries import get_employees_percentage_by_location
+from employee_insights.queries import get_employees_percentage_by_location, \
+    get_employees_percentage_by_location_rollup
 from tests.strategies import employee_databases
 from tests.common import get_company_employees
 
@@ -64,7 +65,12 @@ def get_expected(employee_data, location, min_percentage):
         """
         fields = location_fields[n:]
         filter_func = partial(are_all_attrs_equal, params, attrs=fields)
-        employee_location = next(filter(filter_func, employee_data.locations))
+        employee_location = next(filter(filter_func, employee_data.locations), None)
+
+        # the location parameters can be drawn from different locations, in
+        # which case no employee is at the location.
+        if employee_location is None:
+            return None, lambda employee: False
 
         location = '/'.join(
             getattr(employee_location, x)
@@ -153,3 +159,41 @@ def test_get_employees_percentage_by_location(employee_database, data, min_perce
         # perform these sanity checks.
         for location in actual_result:
             assert 0 <= location.percentage <= 100
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.integers(min_value=0, max_value=100))
+def test_get_employees_percentage_by_location_rollup(employee_database, min_percentage):
+    """
+    Verify that get_employees_percentage_by_location_rollup gives the
+    percentage of employees of each company at every location path,
+    calculated in python.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param min_percentage: The minimum percentage a location should meet to be
+                           included in the result set.
+    """
+    employee_data, session = employee_database
+    location_fields = ['continent', 'country', 'state', 'city']
+
+    expected_result = []
+    for company, company_employees in get_company_employees(employee_data):
+        for depth in range(1, len(location_fields) + 1):
+            paths = collections.Counter(
+                '/'.join(employee_data.locations[x.location_id - 1][field]
+                         for field in location_fields[:depth])
+                for x in company_employees
+            )
+            for path, n_employees_in_location in sorted(paths.items()):
+                percentage = n_employees_in_location / float(len(company_employees)) * 100
+                if percentage > min_percentage:
+                    expected_result.append((company.company_id, depth, path, percentage))
+
+    actual_result = get_employees_percentage_by_location_rollup(session, min_percentage).all()
+
+    assert len(actual_result) == len(expected_result)
+    for actual, expected in zip(actual_result, expected_result):
+        company_id, depth, location, percentage = expected
+        assert (actual.company_id, actual.depth, actual.location) == (company_id, depth, location)
+        assert pytest.approx(float(actual.percentage)) == percentage
@@ -1,16 +1,23 @@
 # std
 import io
+import os
+import csv
 import datetime
+import collections
 from unittest import mock
 # 3rd party
 import pytest
 from hypothesis import given, settings
 import hypothesis.extra.datetime as st_dt
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 # local
-from employee_insights.models import Base
-from employee_insights.serializer import CsvSerializer, date_of_birth_to_age, age_to_date_of_birth
+from employee_insights.models import Base, Employee, Company, Location, JobTitle, LocationPath, \
+    CompanyStatistics, CompanyAgeIndex, CompanyJobTitleStatistics, CompanyLocationStatistics
+from employee_insights.serializer import CsvSerializer, CsvRecord, date_of_birth_to_age, age_to_date_of_birth, \
+    parse_parallel
+from employee_insights import statistics
+from employee_insights.statistics import update_statistics
 from tests.strategies import employee_databases
 
 
@@ -67,3 +74,356 @@ def test_serializer(employee_database, timestamp):
         assert dump1
         assert dump2
         assert dump1 == dump2
+
+
+
+def load_and_dump(path, timestamp, **options):
+    """
+    Load a csv file into a new in-memory database and dump it again.
+
+    :param path: Path to the csv file to load.
+    :param timestamp: The timestamp to assume for calculating ages.
+    :param options: Options passed to the ``CsvSerializer`` used for loading.
+
+    :return: The csv dump of the database.
+    """
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(path, encoding='utf-8') as load:
+        CsvSerializer(session, **options).load(load, timestamp)
+
+    with io.StringIO() as dump:
+        CsvSerializer(session).dump(dump, timestamp)
+        return dump.getvalue()
+
+
+data_set_path = os.path.join(os.path.dirname(__file__), 'data', 'DataSet_0.csv')
+
+
+def test_bulk_load():
+    """
+    Verify that loading in bulk with Core inserts gives the same database as
+    loading through the orm, by comparing the csv dumps of both databases.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    orm_dump = load_and_dump(data_set_path, timestamp)
+    bulk_dump = load_and_dump(data_set_path, timestamp, bulk=True, batch_size=100)
+
+    assert orm_dump
+    assert orm_dump == bulk_dump
+
+
+def test_chunked_load():
+    """
+    Verify that streaming the csv file in chunks gives the same database as
+    loading it at once, and that progress is reported after every chunk.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+    progress = []
+
+    orm_dump = load_and_dump(data_set_path, timestamp)
+    chunked_dump = load_and_dump(data_set_path, timestamp, chunk_size=100,
+                                 progress=progress.append)
+
+    assert orm_dump == chunked_dump
+    assert progress == [100, 200, 300, 400, 500, 600, 700, 714]
+
+
+def test_chunked_load_duplicates(tmpdir):
+    """
+    Verify that streaming the csv file in chunks keeps the first row of a
+    record id, like loading it at once, for repeated record ids within a
+    chunk and in a later chunk.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    with open(data_set_path, encoding='utf-8') as f:
+        headers, *records = f.readlines()
+    path = str(tmpdir.join('duplicates.csv'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines([headers, records[0]] + records + [records[1].replace(',Europe,', ',Asia,')])
+
+    orm_dump = load_and_dump(path, timestamp)
+    chunked_dump = load_and_dump(path, timestamp, chunk_size=100)
+    staged_dump = load_and_dump(path, timestamp, chunk_size=100, staging=True)
+
+    assert len(orm_dump.splitlines()) == len(records) + 1
+    assert orm_dump == chunked_dump == staged_dump
+
+
+def test_delete_all():
+    """
+    Verify that deleting all records also deletes the statistics and the
+    location paths, so nothing of a previous dataset remains.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(data_set_path, encoding='utf-8') as load:
+        CsvSerializer(session, bulk=True).load(load, timestamp)
+    tables = [x for x in Base.metadata.sorted_tables if x.name != 'dataset']
+    assert all(session.query(x).count() for x in tables)
+
+    CsvSerializer(session)._delete_all()
+    assert not any(session.query(x).count() for x in tables)
+
+
+def test_load_phases():
+    """
+    Verify that the phases of an import are reported in order, for every
+    chunk when loading in chunks.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+    phases = []
+
+    load_and_dump(data_set_path, timestamp, bulk=True, phase=phases.append)
+    assert phases == ['parse', 'delete', 'dimension', 'insert', 'commit']
+
+    phases.clear()
+    load_and_dump(data_set_path, timestamp, chunk_size=500, phase=phases.append)
+    assert phases == ['delete'] + ['parse', 'dimension', 'insert', 'commit'] * 2 + ['parse', 'commit']
+
+    phases.clear()
+    load_and_dump(data_set_path, timestamp, chunk_size=500, staging=True, phase=phases.append)
+    assert phases == ['parse', 'dimension', 'insert', 'commit'] * 2 + ['parse', 'commit']
+
+
+def test_load_report():
+    """
+    Verify that the load report contains the number of rows, every phase
+    and the dimension cardinalities, and the peak memory when traced.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(data_set_path, encoding='utf-8') as load:
+        report = CsvSerializer(session, bulk=True).load(load, timestamp)
+
+    assert report['rows'] == session.query(Employee).count()
+    assert report['dimensions'] == dict(
+        companies=session.query(Company).count(),
+        locations=session.query(Location).count(),
+        job_titles=session.query(JobTitle).count(),
+    )
+    assert [x['phase'] for x in report['phases']] == ['parse', 'delete', 'dimension', 'insert', 'commit']
+    assert report['peak_memory'] is None
+    assert set(report['parse']) == {'read', 'date_of_birth', 'encode'}
+
+    with open(data_set_path, encoding='utf-8') as load:
+        report = CsvSerializer(session, chunk_size=500, trace_memory=True).load(load, timestamp)
+
+    assert report['rows'] == session.query(Employee).count()
+    assert all(x['peak_memory'] > 0 for x in report['phases'])
+    assert report['peak_memory'] == max(x['peak_memory'] for x in report['phases'])
+
+
+def test_parallel_load():
+    """
+    Verify that parsing in parallel gives the records in file order, with
+    the dates of birth calculated, and the same database as parsing serially.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    with open(data_set_path, encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        expected_records = [CsvRecord(*x, timestamp=timestamp) for x in reader]
+    actual_records = list(parse_parallel(data_set_path, timestamp, workers=2, range_size=1000))
+
+    assert [x.astuple()[:-1] for x in actual_records] == \
+           [x.astuple()[:-1] for x in expected_records]
+    assert [x.date_of_birth_day for x in actual_records] == \
+           [x.date_of_birth.toordinal() for x in expected_records]
+
+    orm_dump = load_and_dump(data_set_path, timestamp)
+    parallel_dump = load_and_dump(data_set_path, timestamp, workers=2)
+
+    assert orm_dump == parallel_dump
+
+
+def test_staged_load():
+    """
+    Verify that loading into staging tables gives the same database as
+    loading directly, that it replaces a previous dataset and that a failed
+    import leaves the previous dataset in place.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    orm_dump = load_and_dump(data_set_path, timestamp)
+    staged_dump = load_and_dump(data_set_path, timestamp, staging=True)
+    chunked_dump = load_and_dump(data_set_path, timestamp, staging=True, chunk_size=100)
+
+    assert orm_dump == staged_dump == chunked_dump
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    for _ in range(2):
+        with open(data_set_path, encoding='utf-8') as load:
+            CsvSerializer(session, staging=True).load(load, timestamp)
+    assert session.query(Employee).count() == 714
+
+    invalid = ',Job Title,Location,Location,Location,Location,Age,first_name,last_name,Company\n1,2\n'
+    with pytest.raises(TypeError):
+        CsvSerializer(session, staging=True).load(io.StringIO(invalid), timestamp)
+    assert session.query(Employee).count() == 714
+    assert set(engine.table_names()) == set(Base.metadata.tables) | {'sqlite_sequence'}
+
+
+def test_incremental_load():
+    """
+    Verify that an incremental load only writes the employees that changed,
+    and that it gives the same employees as loading the changed file from
+    scratch.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    with open(data_set_path, encoding='utf-8') as f:
+        headers, *records = f.readlines()
+
+    changed = [headers] + records[1:]               # delete the first record
+    changed[1] = changed[1].replace(',Amatseru', ',New Company')
+    changed[2] = changed[2].replace(',Europe,', ',Asia,')
+    changed.append('99999,Tester,Europe,Netherlands,Utrecht,Utrecht,30,New,Employee,Rocinante\n')
+    changed = ''.join(changed)
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(data_set_path, encoding='utf-8') as load:
+        CsvSerializer(session).load(load, timestamp)
+
+    serializer = CsvSerializer(session, incremental=True)
+    serializer.load(io.StringIO(changed), timestamp)
+    assert serializer.changes == dict(inserted=1, updated=2, deleted=1)
+
+    serializer.load(io.StringIO(changed), timestamp)
+    assert serializer.changes == dict(inserted=0, updated=0, deleted=0)
+
+    def get_employees(dump):
+        return sorted(x.split(',', 1)[1] for x in dump.splitlines()[1:])
+
+    with io.StringIO() as dump:
+        CsvSerializer(session).dump(dump, timestamp)
+        incremental_dump = dump.getvalue()
+
+    with io.StringIO(changed) as load:
+        engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+        CsvSerializer(session).load(load, timestamp)
+    with io.StringIO() as dump:
+        CsvSerializer(session).dump(dump, timestamp)
+        full_dump = dump.getvalue()
+
+    assert get_employees(incremental_dump) == get_employees(full_dump)
+
+
+def get_statistics(session):
+    """
+    :return: dict with the rows of the statistics tables, with the dates of
+             birth of the employees of a company in the order of the age
+             index and whether their positions are consecutive, instead of
+             the positions which depend on the order of updates.
+    """
+    ages, positions = collections.defaultdict(list), collections.defaultdict(list)
+    for row in session.query(CompanyAgeIndex).order_by(CompanyAgeIndex.position):
+        ages[row.company_id].append(row.date_of_birth_day)
+        positions[row.company_id].append(row.position)
+
+    return dict(
+        companies=sorted(
+            (x.company_id, x.employee_count, x.date_of_birth_sum,
+             positions[x.company_id] == list(range(x.first_position, x.first_position + x.employee_count)))
+            for x in session.query(CompanyStatistics)),
+        ages=dict(ages),
+        job_titles=sorted(tuple(x) for x in session.query(CompanyJobTitleStatistics.__table__).all()),
+        locations=sorted(tuple(x) for x in session.query(CompanyLocationStatistics.__table__).all()),
+        location_paths=sorted(tuple(x) for x in session.query(LocationPath.__table__).all()),
+    )
+
+
+def test_incremental_statistics(monkeypatch):
+    """
+    Verify that an incremental load in batches gives the same statistics as
+    updating all statistics, only reads the employees of the record ids in
+    a batch, without a timestamp leaves unchanged employees unchanged, and
+    that a file without employees removes all employees, also those with a
+    repeated record id.
+    """
+    monkeypatch.setattr(statistics, 'MAX_IN_VALUES', 2)
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    with open(data_set_path, encoding='utf-8') as f:
+        headers, *records = f.readlines()
+
+    changed = [headers] + records[1:]
+    changed[1] = changed[1].replace(',Amatseru', ',New Company')
+    changed[2] = changed[2].replace(',Europe,', ',Asia,')
+    changed[3] = changed[3].replace(',Production Accounter Junior,', ',Tester,')
+    changed.append('99999,Tester,Europe,Netherlands,Utrecht,Utrecht,30,New,Employee,Rocinante\n')
+    changed.append(records[1])                      # repeated in a later batch
+    changed = ''.join(changed)
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    duplicates = ''.join([headers, records[0]] + records)
+    CsvSerializer(session, chunk_size=100).load(io.StringIO(duplicates), timestamp)
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(' '.join(statement.split())))
+    serializer = CsvSerializer(session, incremental=True, batch_size=100)
+    serializer.load(io.StringIO(changed))
+    assert serializer.changes == dict(inserted=1, updated=3, deleted=1)
+    employee_reads = [x for x in statements if x.startswith('SELECT employee.employee_id')]
+    assert employee_reads and all('WHERE' in x for x in employee_reads)
+
+    incremental_statistics = get_statistics(session)
+    update_statistics(session)
+    assert incremental_statistics == get_statistics(session)
+
+    serializer.load(io.StringIO(changed))
+    assert serializer.changes == dict(inserted=0, updated=0, deleted=0)
+
+    serializer.load(io.StringIO(headers))
+    assert serializer.changes == dict(inserted=0, updated=0, deleted=len(records))
+    assert session.query(Employee).count() == 0
+    empty_statistics = get_statistics(session)
+    assert not any(empty_statistics[x] for x in ('companies', 'ages', 'job_titles', 'locations'))
+
+
+def test_dump_query_count():
+    """
+    Verify that dumping the database uses a single query, independent of the
+    number of employees.
+    """
+    timestamp = datetime.datetime(2017, 4, 1)
+
+    engine = create_engine('sqlite:///:memory:')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    with open(data_set_path, encoding='utf-8') as load:
+        CsvSerializer(session).load(load, timestamp)
+
+    statements = []
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+
+    chunks = list(CsvSerializer(session, batch_size=100).iter_dump(timestamp))
+
+    assert len(statements) == 1
+    assert len(chunks) == 1 + 8
+    assert ''.join(chunks).count('\n') == 1 + 714
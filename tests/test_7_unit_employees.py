@@ -0,0 +1,34 @@
+# 3rd party
+from hypothesis import strategies as st, given, settings
+# local
+from employee_insights.queries import get_employees
+from tests.strategies import employee_databases
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.integers(min_value=1, max_value=10))
+def test_get_employees_pages(employee_database, limit):
+    """
+    Verify that paging through the employees with get_employees, using the
+    last employee id of a page as the start of the next, gives all employees
+    exactly once and in order of id.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param limit: The number of employees per page.
+    """
+    employee_data, session = employee_database
+
+    actual_result = []
+    after = None
+    while True:
+        page = get_employees(session, after, limit).all()
+        assert len(page) <= limit
+        if not page:
+            break
+        actual_result += [x.employee_id for x in page]
+        after = page[-1].employee_id
+
+    expected_result = [x.employee_id for x in employee_data.employees]
+
+    assert actual_result == expected_result
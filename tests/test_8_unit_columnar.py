@@ -0,0 +1,71 @@
+# std
+import datetime
+# 3rd party
+import pytest
+from hypothesis import strategies as st, given, settings
+# local
+from employee_insights import queries, columnar
+from employee_insights.queries import get_locations
+from tests.strategies import employee_databases
+pytest.importorskip('numpy')
+
+
+today = datetime.date(2017, 4, 1)
+
+
+def assert_same_result(query, session, **parameters):
+    """
+    Verify that a query of the columnar backend gives the same result as the
+    sql query of the same name, ignoring the order of the records.
+
+    :param query: The name of the query function.
+    :param session: SQLAlchemy session of the database to query.
+    :param parameters: Keyword parameters for the query function.
+    """
+    expected_result = [tuple(x) for x in getattr(queries, query)(session, **parameters)]
+    actual_result = [tuple(x) for x in getattr(columnar, query)(session, **parameters)]
+    assert sorted(actual_result) == sorted(expected_result)
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.floats(min_value=-100, max_value=100))
+def test_columnar_age(employee_database, years):
+    """
+    Verify that the columnar age queries give the same result as the sql
+    queries.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param years: Find percentage of employees this number of years older
+                  than the company-wide average.
+    """
+    employee_data, session = employee_database
+    assert_same_result('get_employees_per_company', session)
+    assert_same_result('get_company_statistics', session, as_of=today)
+    assert_same_result('get_employees_percentage_older_than_average', session,
+                       years=years, as_of=today)
+    assert_same_result('get_employees_percentage_older_than_average_curve', session,
+                       years=[0, years, 2 * years], as_of=today)
+    assert_same_result('get_age_quantiles', session, quantiles=[0, 0.1, 0.5, 0.9, 1], as_of=today)
+    assert_same_result('get_age_distribution', session,
+                       ages=[0, 20, 40 + years / 10, 60, 200], as_of=today)
+
+
+@settings(max_examples=50)
+@given(employee_databases(), st.integers(min_value=0, max_value=100))
+def test_columnar_location(employee_database, min_percentage):
+    """
+    Verify that the columnar location and job title queries give the same
+    result as the sql queries.
+
+    :param employee_database: tuple of (employee data, SQLAlchemy session)
+                              which should be used for testing.
+    :param min_percentage: The minimum percentage to filter the results by.
+    """
+    employee_data, session = employee_database
+    assert_same_result('get_employees_percentage_per_job_title', session)
+    assert_same_result('get_employees_percentage_by_location_rollup', session,
+                       min_percentage=min_percentage)
+    for location, in get_locations(session).all() + [('Nowhere',)]:
+        assert_same_result('get_employees_percentage_by_location', session,
+                           location=location, min_percentage=min_percentage)
@@ -0,0 +1,95 @@
+# 3rd party
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+# local
+from employee_insights import metrics
+from employee_insights.slow_queries import SlowQueryLog, redact
+
+
+def test_histogram():
+    """
+    Verify that the bucket counts of a histogram are cumulative and that
+    values equal to an upper bound are counted in that bucket.
+    """
+    histogram = metrics.Histogram(buckets=(1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+
+    assert histogram.get_cumulative_counts() == [('1.0', 2), ('2.0', 3), ('+Inf', 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 6.0
+
+
+def test_query_duration():
+    """
+    Verify that the sql statements are timed per query function and exposed
+    in the text format.
+    """
+    registry = metrics.metrics
+    registry.clear()
+    event.listen(Engine, 'before_cursor_execute', metrics.before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', metrics.after_cursor_execute)
+    try:
+        engine = create_engine('sqlite://')
+        metrics.set_query('get_companies')
+        engine.execute('select 1').fetchall()
+        engine.execute('select 2').fetchall()
+        metrics.set_query(None)
+        engine.execute('select 3').fetchall()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', metrics.before_cursor_execute)
+        event.remove(Engine, 'after_cursor_execute', metrics.after_cursor_execute)
+
+    histograms = registry.histograms['employee_insights_query_duration_seconds']
+    assert histograms[(('query', 'get_companies'),)].count == 2
+    assert histograms[(('query', 'other'),)].count == 1
+
+    lines = registry.expose().splitlines()
+    assert '# TYPE employee_insights_query_duration_seconds histogram' in lines
+    assert 'employee_insights_query_duration_seconds_bucket{query="get_companies",le="+Inf"} 2' in lines
+    assert 'employee_insights_query_duration_seconds_count{query="other"} 1' in lines
+    registry.clear()
+
+
+def test_slow_query_log():
+    """
+    Verify that statements over the threshold are recorded with the types of
+    their parameters, or the values when enabled, and their query plan, and
+    that statements of the same shape are counted together.
+    """
+    log = SlowQueryLog(threshold=0.0, log_parameters=False)
+    engine = create_engine('sqlite://')
+    connection = engine.raw_connection()
+    cursor = connection.cursor()
+    cursor.execute('create table employee (employee_id integer primary key, company_id integer)')
+
+    for statement, parameters in [
+            ('select * from employee where company_id = ?', (1,)),
+            ('select * from employee  where company_id in (?, ?)', (1, 2)),
+            ('select * from employee where company_id in (?, ?, ?)', (1, 2, 3)),
+    ]:
+        cursor.execute(statement, parameters)
+        log.observe(cursor, statement, parameters, 0.5, 'get_employees')
+
+    equal, in_list = log.get_slowest(2)
+    assert equal['count'] == 1
+    assert in_list['statement'] == 'select * from employee where company_id in (?, ...)'
+    assert in_list['count'] == 2
+    assert in_list['slow_count'] == 2
+    assert in_list['queries'] == ['get_employees']
+    assert in_list['slowest']['parameters'] == '(int, int)'
+    assert any('SCAN' in x for x in equal['slowest']['plan'])
+
+    log = SlowQueryLog(threshold=0.0, log_parameters=True)
+    log.observe(cursor, 'select * from employee where company_id = ?', (1,), 0.5, 'get_employees')
+    assert log.get_slowest(1)[0]['slowest']['parameters'] == '(1,)'
+    connection.close()
+
+
+def test_redact():
+    """
+    Verify that the values of bound parameters are replaced by their types.
+    """
+    assert redact(('Ivan', 1, None)) == '(str, int, NoneType)'
+    assert redact([('Ivan', 1.5), ('Chow', 2.5)]) == '[(str, float), (str, float)]'
+    assert redact({'first_name': 'Ivan'}) == "{'first_name': str}"
@@ -0,0 +1,352 @@
+"""
+Benchmark importing, exporting and the api endpoints on generated data sets
+of increasing size, and write the results to a json file so that releases
+can be compared and regressions caught before deploying.
+
+usage: python benchmark.py [--sizes 10000,1000000,10000000] [--requests 20]
+                           [--cached] [--output benchmark.json]
+                           [--compare previous.json] [--tolerance 0.2]
+
+For every size a csv file is generated with ``generate_dataset.py`` using
+its default distributions and a fixed seed, which is then:
+
+    - imported with ``CsvSerializer.load`` as uploads are imported,
+    - exported with ``CsvSerializer.dump`` and with the ``/export`` view,
+    - requested ``--requests`` times from every endpoint in ``ENDPOINTS``,
+      with an empty result cache unless ``--cached`` is given.
+
+Every benchmark runs in a new process so the peak resident set size which
+is reported is that of the benchmark alone. The analytics backend is
+selected with the ``EMPLOYEE_INSIGHTS_ANALYTICS_BACKEND`` environment
+variable as for the application.
+
+With ``--compare`` the throughput of every benchmark is compared with the
+results in an earlier output file, the exit status is 1 when any of these
+is more than ``--tolerance`` lower.
+"""
+# std
+import os
+import sys
+import json
+import math
+import time
+import sqlite3
+import argparse
+import datetime
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(__dir__, '..'))
+# local
+from employee_insights import database
+from generate_dataset import write_dataset
+
+
+timestamp = datetime.datetime(2017, 4, 1)
+
+
+DEFAULT_SIZES = (10000, 1000000, 10000000)
+
+
+# the urls of the endpoints to benchmark, with the maximum number of requests
+# or None to use the number of requests given on the command line.
+ENDPOINTS = (
+    ('/api/employees', 3),
+    ('/api/employees?limit=1000', None),
+    ('/api/locations', None),
+    ('/api/employees/percentage_older_than_average?years=2', None),
+    ('/api/employees/percentage_older_than_average_curve?start=-10&stop=10&step=1', None),
+    ('/api/employees/age_quantiles', None),
+    ('/api/employees/age_distribution', None),
+    ('/api/employees/percentage_by_location?location=Europe&min_percentage=10', None),
+    ('/api/employees/percentage_by_location?location=Europe/Netherlands/South%20Holland', None),
+    ('/api/employees/percentage_by_location_rollup?min_percentage=10', None),
+    ('/api/employees/percentage_per_job_title', None),
+)
+
+
+def write_csv(path, n_employees):
+    """
+    Write a generated data set, which is the same for every run.
+
+    :param path: The path of the csv file to write.
+    :param n_employees: The number of employee records to generate.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        write_dataset(f, n_employees, seed=0)
+
+
+def get_peak_rss():
+    """
+    :return: The peak resident set size of this process in bytes.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def get_percentile(values, percentile):
+    """
+    :param values: Sorted list of values.
+    :param percentile: The percentile, between 0 and 100.
+
+    :return: The nearest rank percentile of ``values``.
+    """
+    return values[max(math.ceil(percentile / 100 * len(values)) - 1, 0)]
+
+
+def get_app(database_path):
+    """
+    Get the application with the database at ``database_path``.
+
+    :param database_path: Path of the SQLite database file.
+
+    :return: The Flask application.
+    """
+    database.database_path = database_path
+    from employee_insights.app import app
+    return app
+
+
+def read_response(client, url):
+    """
+    Request a url and read the streamed response.
+
+    :param client: Flask test client.
+    :param url: The url to request.
+
+    :return: tuple of (status code, number of bytes).
+    """
+    response = client.get(url, buffered=False)
+    try:
+        return response.status_code, sum(len(x) for x in response.response)
+    finally:
+        response.close()
+
+
+def benchmark_import(database_path, csv_path, n_employees):
+    """
+    Import a csv file into a new database as uploads are imported.
+
+    :return: dict with the result of the benchmark.
+    """
+    from employee_insights.api import IMPORT_CHUNK_SIZE
+    from employee_insights.serializer import CsvSerializer
+
+    database.database_path = database_path
+    with database.closing_session(database.get_engine()) as session, \
+         open(csv_path, encoding='utf-8', newline='') as fileobj:
+        start = time.perf_counter()
+        report = CsvSerializer(session, chunk_size=IMPORT_CHUNK_SIZE, staging=True).load(fileobj, timestamp)
+        seconds = time.perf_counter() - start
+
+    return dict(seconds=seconds, rows_per_second=n_employees / seconds, phases=report['phases'])
+
+
+def benchmark_dump(database_path, csv_path, n_employees):
+    """
+    Export the database with ``CsvSerializer.dump``.
+
+    :return: dict with the result of the benchmark.
+    """
+    from employee_insights.serializer import CsvSerializer
+
+    database.database_path = database_path
+    with database.closing_session(database.get_engine()) as session, \
+         open(os.devnull, 'w', encoding='utf-8') as fileobj:
+        start = time.perf_counter()
+        CsvSerializer(session).dump(fileobj, timestamp)
+        seconds = time.perf_counter() - start
+
+    return dict(seconds=seconds, rows_per_second=n_employees / seconds)
+
+
+def benchmark_export(database_path, csv_path, n_employees):
+    """
+    Export the database with the ``/export`` view.
+
+    :return: dict with the result of the benchmark.
+    """
+    client = get_app(database_path).test_client()
+    start = time.perf_counter()
+    status, n_bytes = read_response(client, '/export')
+    seconds = time.perf_counter() - start
+
+    return dict(seconds=seconds, rows_per_second=n_employees / seconds, status=status, bytes=n_bytes)
+
+
+def benchmark_endpoint(database_path, url, n_requests, cached):
+    """
+    Request an endpoint ``n_requests`` times.
+
+    :return: dict with the result of the benchmark.
+    """
+    from employee_insights.api import result_cache
+
+    client = get_app(database_path).test_client()
+    # the first request opens the connections and loads the columnar store
+    read_response(client, url)
+
+    latencies, statuses, n_bytes = [], set(), 0
+    for _ in range(n_requests):
+        if not cached:
+            result_cache.clear()
+        start = time.perf_counter()
+        status, n_bytes = read_response(client, url)
+        latencies.append(time.perf_counter() - start)
+        statuses.add(status)
+
+    latencies.sort()
+    return dict(
+        seconds=sum(latencies),
+        requests_per_second=n_requests / sum(latencies),
+        p50=get_percentile(latencies, 50),
+        p99=get_percentile(latencies, 99),
+        status=max(statuses),
+        bytes=n_bytes,
+    )
+
+
+def run(benchmark, *args):
+    """
+    Run a benchmark function in a new process.
+
+    :param benchmark: The benchmark function.
+    :param args: The arguments of the benchmark function.
+
+    :return: dict with the result of the benchmark and the peak resident set
+             size of the process.
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        return executor.submit(run_in_process, benchmark, *args).result()
+
+
+def run_in_process(benchmark, *args):
+    result = benchmark(*args)
+    result['peak_rss'] = get_peak_rss()
+    return result
+
+
+def benchmark_size(n_employees, n_requests, cached):
+    """
+    Run all benchmarks on a generated data set.
+
+    :param n_employees: The number of employees in the data set.
+    :param n_requests: The number of requests per endpoint.
+    :param cached: Whether the endpoints may answer from the result cache.
+
+    :return: Generator which when iterated yields a dict with the result of
+             every benchmark.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = os.path.join(directory, 'employees.csv')
+        database_path = os.path.join(directory, 'employee_insights.db')
+        write_csv(csv_path, n_employees)
+
+        for name, benchmark in (('import', benchmark_import),
+                                ('dump', benchmark_dump),
+                                ('export', benchmark_export)):
+            result = run(benchmark, database_path, csv_path, n_employees)
+            yield dict(benchmark=name, n_employees=n_employees, **result)
+
+        for url, max_requests in ENDPOINTS:
+            requests = min(n_requests, max_requests or n_requests)
+            result = run(benchmark_endpoint, database_path, url, requests, cached)
+            yield dict(benchmark='endpoint', url=url, n_employees=n_employees,
+                       requests=requests, cached=cached, **result)
+
+
+def get_key(result):
+    return result['benchmark'], result.get('url'), result['n_employees']
+
+
+def get_throughput(result):
+    return result.get('rows_per_second') or result.get('requests_per_second')
+
+
+def compare(results, previous_results, tolerance):
+    """
+    Compare the throughput of benchmarks with earlier results.
+
+    :param results: list of benchmark results.
+    :param previous_results: list of earlier benchmark results.
+    :param tolerance: The fraction by which the throughput may be lower.
+
+    :return: list of tuples of (result, earlier result) of the benchmarks of
+             which the throughput is lower than allowed.
+    """
+    previous = {get_key(x): x for x in previous_results}
+    return [
+        (result, previous[get_key(result)])
+        for result in results
+        if get_key(result) in previous
+        and get_throughput(result) < (1 - tolerance) * get_throughput(previous[get_key(result)])
+    ]
+
+
+def get_revision():
+    """
+    :return: The git commit of the benchmarked code, or None outside of a
+             git checkout.
+    """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=__dir__,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='comma separated numbers of employees')
+    parser.add_argument('--requests', type=int, default=20,
+                        help='the number of requests per endpoint')
+    parser.add_argument('--cached', action='store_true',
+                        help='allow endpoints to answer from the result cache')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--compare', help='earlier output file to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the fraction by which the throughput may be lower')
+    args = parser.parse_args()
+
+    results = []
+    for n_employees in map(int, args.sizes.split(',')):
+        for result in benchmark_size(n_employees, args.requests, args.cached):
+            results.append(result)
+            latency = f", p50 {result['p50'] * 1000:.1f}ms, p99 {result['p99'] * 1000:.1f}ms" \
+                if 'p50' in result else ''
+            print(f"{result['benchmark']:>8} {result.get('url', ''):<80} {n_employees:>9}: "
+                  f"{get_throughput(result):.1f}/s{latency}, "
+                  f"peak rss {result['peak_rss'] / 2 ** 20:.0f} MiB", flush=True)
+
+    output = dict(
+        revision=get_revision(),
+        created_at=datetime.datetime.now().isoformat(),
+        python=platform.python_version(),
+        sqlite=sqlite3.sqlite_version,
+        platform=platform.platform(),
+        cpu_count=os.cpu_count(),
+        analytics_backend=os.environ.get('EMPLOYEE_INSIGHTS_ANALYTICS_BACKEND', 'sql'),
+        results=results,
+    )
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for result, previous in regressions:
+            print(f"regression: {result['benchmark']} {result.get('url', '')} "
+                  f"{result['n_employees']}: {get_throughput(result):.1f}/s, "
+                  f"was {get_throughput(previous):.1f}/s")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
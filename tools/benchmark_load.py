@@ -0,0 +1,92 @@
+"""
+Compare the time and peak memory of loading a csv file with the orm and the
+bulk loader of ``CsvSerializer``.
+
+usage: python benchmark_load.py [n_employees]
+
+The input is generated by repeating the records of the sample data set until
+there are ``n_employees`` records.
+"""
+# std
+import io
+import os
+import sys
+import csv
+import time
+import datetime
+import tempfile
+import tracemalloc
+__dir__ = os.path.dirname(__file__)
+sys.path.insert(0, os.path.join(__dir__, '..'))
+# 3rd party
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+# local
+from employee_insights.models import Base, Employee
+from employee_insights.serializer import CsvSerializer
+
+
+sample_path = os.path.join(__dir__, '..', 'specification', 'DataSet_0.csv')
+timestamp = datetime.datetime(2017, 4, 1)
+
+
+def generate_csv(n_employees):
+    """
+    Generate csv data by repeating the records from the sample data set.
+
+    :param n_employees: The number of employee records to generate.
+
+    :return: String containing the csv data.
+    """
+    with open(sample_path, encoding='utf-8') as f:
+        reader = csv.reader(f)
+        headers = next(reader)
+        records = list(reader)
+
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(headers)
+    for record_id in range(n_employees):
+        record = records[record_id % len(records)]
+        writer.writerow([record_id] + record[1:])
+    return output.getvalue()
+
+
+def benchmark(data, **options):
+    """
+    Load the csv data into a new database file.
+
+    :param data: The csv data to load.
+    :param options: Options passed to ``CsvSerializer``.
+
+    :return: tuple of (seconds, peak allocated bytes, employee count)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine('sqlite:///' + os.path.join(directory, 'benchmark.db'))
+        Base.metadata.create_all(engine)
+        session = sessionmaker(bind=engine)()
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        CsvSerializer(session, **options).load(io.StringIO(data), timestamp)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        count = session.query(Employee).count()
+        session.close()
+        engine.dispose()
+
+    return seconds, peak, count
+
+
+def main(n_employees=100000):
+    data = generate_csv(n_employees)
+    for name, options in (('orm', dict(bulk=False)), ('bulk', dict(bulk=True))):
+        seconds, peak, count = benchmark(data, **options)
+        print(f'{name:>5}: {count} employees in {seconds:.2f}s '
+              f'({count / seconds:.0f} rows/s), peak memory {peak / 2 ** 20:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
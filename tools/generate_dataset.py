@@ -0,0 +1,222 @@
+"""
+Generate a csv file in the upload format with a given number of employees,
+for load tests and capacity planning.
+
+usage: python generate_dataset.py n_employees [--output employees.csv]
+                                  [--seed 0] [--companies 100]
+                                  [--locations 40] [--job-titles 300]
+                                  [--company-skew 1.0] [--location-skew 1.0]
+                                  [--job-title-skew 1.0]
+
+The locations are those of ``tests/data/locations.csv`` and the job titles,
+company names, first names and last names are those of the sample data set.
+When more distinct values are requested than there are in these pools,
+numbered variants are added (e.g. ``Hermes 2``).
+
+Employees are assigned to companies, locations and job titles with a Zipf
+distribution, the skew is its exponent: 0 gives a uniform distribution and
+larger values concentrate the employees in fewer companies, locations or job
+titles. The ages are normally distributed around an average which differs
+per company.
+
+The output only depends on the arguments, the same seed gives the same file.
+"""
+# std
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import itertools
+__dir__ = os.path.dirname(os.path.abspath(__file__))
+
+
+sample_path = os.path.join(__dir__, '..', 'specification', 'DataSet_0.csv')
+locations_path = os.path.join(__dir__, '..', 'tests', 'data', 'locations.csv')
+
+HEADERS = ['', 'Job Title', 'Location', 'Location', 'Location', 'Location',
+           'Age', 'first_name', 'last_name', 'Company']
+
+# the number of employees generated and written at a time.
+CHUNK_SIZE = 100000
+
+# the ages of the employees of a company are normally distributed with this
+# standard deviation, around an average between MIN_AVERAGE_AGE and
+# MAX_AVERAGE_AGE, and limited to between MIN_AGE and MAX_AGE.
+MIN_AGE, MAX_AGE = 16.0, 70.0
+MIN_AVERAGE_AGE, MAX_AVERAGE_AGE = 30.0, 46.0
+AGE_DEVIATION = 11.0
+
+
+def read_pools():
+    """
+    Read the pools of values from the sample data set and the locations file.
+
+    :return: dict with lists of the distinct values of each field: tuples of
+             (continent, country, state, city) for 'location', strings for
+             'job_title', 'company_name', 'first_name' and 'last_name'.
+    """
+    with open(sample_path, encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        records = list(reader)
+
+    with open(locations_path, encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader)
+        locations = [tuple(x) for x in reader]
+
+    def get_distinct(index):
+        return sorted(set(x[index] for x in records if x[index].strip()))
+
+    return dict(
+        location=sorted(set(locations)),
+        job_title=get_distinct(1),
+        first_name=get_distinct(7),
+        last_name=get_distinct(8),
+        company_name=get_distinct(9),
+    )
+
+
+def get_values(rng, pool, n, number):
+    """
+    Get ``n`` distinct values from a pool in random order, adding numbered
+    variants of the values when the pool is too small.
+
+    :param rng: ``random.Random`` to shuffle with.
+    :param pool: list of distinct values.
+    :param n: The number of values.
+    :param number: Callable which returns a variant of a value given the
+                   value and a number larger than one.
+
+    :return: list of values.
+    """
+    pool = list(pool)
+    rng.shuffle(pool)
+    return [
+        pool[i] if i < len(pool) else number(pool[i % len(pool)], i // len(pool) + 1)
+        for i in range(n)
+    ]
+
+
+def get_cum_weights(n, skew):
+    """
+    :param n: The number of values.
+    :param skew: The exponent of the Zipf distribution.
+
+    :return: list of cumulative weights of the values for ``random.choices``.
+    """
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def generate_records(n_employees, seed=0, companies=100, locations=40, job_titles=300,
+                     company_skew=1.0, location_skew=1.0, job_title_skew=1.0,
+                     chunk_size=CHUNK_SIZE):
+    """
+    Generate employee records in the upload format.
+
+    :param n_employees: The number of employees.
+    :param seed: The seed of the random number generator.
+    :param companies: The number of distinct companies.
+    :param locations: The number of distinct locations.
+    :param job_titles: The number of distinct job titles.
+    :param company_skew: The skew of the number of employees per company.
+    :param location_skew: The skew of the number of employees per location.
+    :param job_title_skew: The skew of the number of employees per job title.
+    :param chunk_size: The number of records generated at a time.
+
+    :return: Generator which when iterated yields lists of at most
+             ``chunk_size`` records, which are lists of the fields of a row
+             of the csv file.
+    """
+    rng = random.Random(seed)
+    pools = read_pools()
+
+    company_names = get_values(rng, pools['company_name'], companies, lambda x, i: f'{x} {i}')
+    job_title_names = get_values(rng, pools['job_title'], job_titles, lambda x, i: f'{x} {i}')
+    location_values = get_values(rng, pools['location'], locations,
+                                 lambda x, i: x[:3] + (f'{x[3]} {i}',))
+    first_names = pools['first_name']
+    last_names = pools['last_name']
+    average_ages = [rng.uniform(MIN_AVERAGE_AGE, MAX_AVERAGE_AGE) for _ in range(companies)]
+
+    company_weights = get_cum_weights(companies, company_skew)
+    location_weights = get_cum_weights(locations, location_skew)
+    job_title_weights = get_cum_weights(job_titles, job_title_skew)
+    company_ids = range(companies)
+
+    for start in range(0, n_employees, chunk_size):
+        n = min(chunk_size, n_employees - start)
+        company_column = rng.choices(company_ids, cum_weights=company_weights, k=n)
+        location_column = rng.choices(location_values, cum_weights=location_weights, k=n)
+        job_title_column = rng.choices(job_title_names, cum_weights=job_title_weights, k=n)
+        first_name_column = rng.choices(first_names, k=n)
+        last_name_column = rng.choices(last_names, k=n)
+        age_column = [
+            '%.10f' % min(max(rng.gauss(average_ages[x], AGE_DEVIATION), MIN_AGE), MAX_AGE)
+            for x in company_column
+        ]
+        columns = zip(itertools.count(start), job_title_column, location_column, age_column,
+                      first_name_column, last_name_column, company_column)
+        yield [
+            [record_id, job_title, *location, age, first_name, last_name, company_names[company_id]]
+            for record_id, job_title, location, age, first_name, last_name, company_id in columns
+        ]
+
+
+def write_dataset(fileobj, n_employees, progress=None, **options):
+    """
+    Write a generated data set as csv.
+
+    :param fileobj: File like object to write the csv data to.
+    :param n_employees: The number of employees.
+    :param progress: Callable which is called with the number of employees
+                     written so far, after every chunk.
+    :param options: Options for ``generate_records``.
+    """
+    writer = csv.writer(fileobj, lineterminator='\n')
+    writer.writerow(HEADERS)
+    n_written = 0
+    for records in generate_records(n_employees, **options):
+        writer.writerows(records)
+        n_written += len(records)
+        if progress:
+            progress(n_written)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('n_employees', type=int)
+    parser.add_argument('--output', default='-', help='path of the csv file, - for stdout')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--companies', type=int, default=100)
+    parser.add_argument('--locations', type=int, default=40)
+    parser.add_argument('--job-titles', type=int, default=300)
+    parser.add_argument('--company-skew', type=float, default=1.0)
+    parser.add_argument('--location-skew', type=float, default=1.0)
+    parser.add_argument('--job-title-skew', type=float, default=1.0)
+    args = parser.parse_args()
+    if min(args.companies, args.locations, args.job_titles) < 1:
+        parser.error('the number of companies, locations and job titles must be at least 1')
+
+    start = time.perf_counter()
+
+    def progress(n_written):
+        seconds = time.perf_counter() - start
+        print(f'{n_written} employees in {seconds:.1f}s ({n_written / seconds:.0f} rows/s)',
+              file=sys.stderr, flush=True)
+
+    options = dict(seed=args.seed, companies=args.companies, locations=args.locations,
+                   job_titles=args.job_titles, company_skew=args.company_skew,
+                   location_skew=args.location_skew, job_title_skew=args.job_title_skew)
+
+    if args.output == '-':
+        write_dataset(sys.stdout, args.n_employees, progress, **options)
+    else:
+        with open(args.output, 'w', encoding='utf-8', newline='') as f:
+            write_dataset(f, args.n_employees, progress, **options)
+
+
+if __name__ == '__main__':
+    main()